@@ -25,6 +25,8 @@ class Settings(BaseSettings):
 
     # AI API
     GEMINI_API_KEY: str = ""
+    # 同时进行的 Gemini 调用上限，超出的任务排队等待
+    GEMINI_CONCURRENCY: int = 8
 
     # CORS
     FRONTEND_URL: str = "http://localhost:5173"
@@ -35,6 +35,10 @@ async def lifespan(app: FastAPI):
     Base.metadata.create_all(bind=engine)
     print(f"Database tables created")
 
+    # 创建上传/结果目录（只在启动时执行一次，而不是每次导入路由模块）
+    generation_v2.UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    generation_v2.RESULT_DIR.mkdir(parents=True, exist_ok=True)
+
     # 初始化任务队列
     print("Task queue initialized")
     print(f"Service started at {datetime.now().isoformat()}")
@@ -43,6 +47,7 @@ async def lifespan(app: FastAPI):
 
     # 关闭时执行
     print("Shutting down service...")
+    task_queue.shutdown()
 
 
 # 创建 FastAPI 应用
@@ -131,8 +136,9 @@ app.include_router(generation.router, tags=["图片生成"])
 app.include_router(generation_v2.router, tags=["图片生成V2"])
 
 # 静态文件服务 - 上传的图片和生成结果
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
-app.mount("/results", StaticFiles(directory="results"), name="results")
+# 目录在 lifespan 中创建，这里跳过导入时的目录存在性检查
+app.mount("/uploads", StaticFiles(directory="uploads", check_dir=False), name="uploads")
+app.mount("/results", StaticFiles(directory="results", check_dir=False), name="results")
 
 
 @app.get("/", summary="API 根路径")
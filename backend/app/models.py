@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Enum, Float
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Enum, Float, Index
 from sqlalchemy.sql import func
 from enum import Enum as PyEnum
 from app.database import Base
@@ -27,6 +27,11 @@ class User(Base):
 
 class GenerationTask(Base):
     __tablename__ = "generation_tasks"
+    __table_args__ = (
+        # 任务历史查询：按用户（及状态）过滤，按创建时间倒序分页
+        Index("ix_generation_tasks_user_created", "user_id", "created_at"),
+        Index("ix_generation_tasks_user_status_created", "user_id", "status", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
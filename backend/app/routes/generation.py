@@ -10,7 +10,7 @@ import logging
 from datetime import datetime
 from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status, Query
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status, Query, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
 
@@ -34,8 +34,6 @@ router = APIRouter(prefix="/api", tags=["generation"])
 # 配置上传目录
 UPLOAD_DIR = "uploads"
 RESULT_DIR = "results"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-os.makedirs(RESULT_DIR, exist_ok=True)
 
 
 def convert_db_status(db_status: DBTaskStatus) -> TaskStatus:
@@ -309,7 +307,12 @@ def get_task_history(
 
     db.commit()
 
-    return {"tasks": tasks, "total": total}
+    # 数据来自数据库，直接构建响应模型并序列化，跳过 response_model 的逐字段校验
+    history = TaskHistoryResponse.model_construct(
+        tasks=[TaskStatusResponse.from_task(task) for task in tasks],
+        total=total
+    )
+    return Response(content=history.model_dump_json(), media_type="application/json")
 
 
 @router.get("/tasks/{task_id}", response_model=TaskStatusResponse)
@@ -7,18 +7,25 @@ import uuid
 import aiofiles
 import asyncio
 import logging
-from typing import Optional, List
+import time
+from functools import lru_cache
+from typing import Optional, List, Dict, Any, Tuple
+from dataclasses import dataclass
+from pathlib import Path
 from datetime import datetime
 
 from fastapi import APIRouter, Depends, UploadFile, File, Query, Form
+from fastapi.responses import FileResponse, ORJSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, load_only
 
 from app.auth import get_current_user
 from app.models import User, GenerationTask, TaskStatus
 from app.database import get_db, SessionLocal
+from app.config import get_settings
+from app.schemas import URL_PREFIXES
 from app.services.image_gen_v2 import (
-    process_image_with_gemini,
+    process_image_with_gemini_async,
     preview_prompt,
     ImageGenV2Error,
     get_gemini_client
@@ -37,7 +44,8 @@ from app.errors import (
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/api/v2", tags=["generation_v2"])
+# 使用 orjson 序列化响应（比标准库 json 快数倍，任务历史等列表接口收益明显）
+router = APIRouter(prefix="/api/v2", tags=["generation_v2"], default_response_class=ORJSONResponse)
 
 
 # ============ WebSocket 推送辅助函数 ============
@@ -72,13 +80,96 @@ async def notify_task_progress(
         else:
             await ws_manager.broadcast_task_update(user_id, data)
     except Exception as e:
-        logger.error(f"Failed to send WebSocket notification: {e}")
+        logger.error("Failed to send WebSocket notification: %s", e)
+
+# 配置上传目录（目录在应用启动时由 main.lifespan 创建，避免每个 worker 导入时重复 makedirs）
+# 请求路径用 f"{UPLOAD_DIR}/{name}" 拼接，不在热路径上走 Path 运算
+UPLOAD_DIR = Path("uploads")
+RESULT_DIR = Path("results")
+
+# 上传图片大小上限（10MB）
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+# 上传文件分块写入大小（64KB）
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# 允许的图片 MIME 类型（包括浏览器可能发送的各种变体）
+ALLOWED_IMAGE_TYPES = frozenset({
+    'image/jpeg', 'image/jpg',
+    'image/png',
+    'image/webp',
+    'image/tiff', 'image/tif',
+    'image/heic', 'image/heif',
+})
+# 同步上传接口额外接受 octet-stream（某些浏览器可能发送这个），再按扩展名判断
+ALLOWED_UPLOAD_TYPES = ALLOWED_IMAGE_TYPES | {'application/octet-stream'}
+# MIME 类型不在允许列表时，按扩展名兜底判断
+ALLOWED_IMAGE_EXTENSIONS = frozenset({'jpg', 'jpeg', 'png', 'webp', 'tiff', 'tif', 'heic', 'heif'})
+
+
+def check_upload_size(file: UploadFile) -> None:
+    """
+    在创建任务记录前检查上传文件大小
+
+    multipart 解析完成后 UploadFile.size 即为文件实际大小，
+    提前拒绝过大文件可避免先写入再标记失败的两次数据库写入
+
+    Raises:
+        AppException: 文件超过 MAX_UPLOAD_SIZE
+    """
+    if file.size is not None and file.size > MAX_UPLOAD_SIZE:
+        raise image_too_large_error(size_mb=file.size / (1024 * 1024), max_mb=10)
+
+
+async def save_upload_file(file: UploadFile, path: str) -> int:
+    """
+    分块将上传文件写入磁盘
+
+    每次只在内存中保留一个分块，超过 MAX_UPLOAD_SIZE 时中止并删除已写入的部分
+
+    Args:
+        file: 上传文件
+        path: 保存路径
+
+    Returns:
+        写入的字节数
+
+    Raises:
+        AppException: 文件超过大小上限
+    """
+    total = 0
+    try:
+        async with aiofiles.open(path, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                total += len(chunk)
+                if total > MAX_UPLOAD_SIZE:
+                    raise image_too_large_error(size_mb=total / (1024 * 1024), max_mb=10)
+                await f.write(chunk)
+    except AppException:
+        os.unlink(path)
+        raise
+    return total
+
+
+def split_file_ext(filename: Optional[str]) -> Tuple[str, str]:
+    """
+    一次扫描提取上传文件的扩展名
 
-# 配置上传目录
-UPLOAD_DIR = "uploads"
-RESULT_DIR = "results"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-os.makedirs(RESULT_DIR, exist_ok=True)
+    只接受短的纯字母数字扩展名，防止文件名中的路径字符拼进保存路径
+
+    Args:
+        filename: 客户端上传的文件名
+
+    Returns:
+        (保存用扩展名, 小写扩展名)，如 (".PNG", "png")；
+        缺失或不合法时返回 (".jpg", "")，小写扩展名为空表示无法据此判断类型
+    """
+    if filename:
+        i = filename.rfind('.')
+        if i >= 0:
+            ext = filename[i:]
+            if 1 < len(ext) <= 10 and ext[1:].isascii() and ext[1:].isalnum():
+                return ext, ext[1:].lower()
+    return '.jpg', ''
 
 
 def make_image_url(path: str) -> str:
@@ -91,27 +182,31 @@ def make_image_url(path: str) -> str:
     Returns:
         完整的 URL，如 "http://localhost:8001/uploads/1_original.png"
     """
-    from app.config import get_settings
-
     if not path:
         return ""
 
     # 如果已经是完整 URL，直接返回
-    if path.startswith("http://") or path.startswith("https://"):
+    if path.startswith(URL_PREFIXES):
         return path
 
-    # 从配置获取后端地址
-    settings = get_settings()
-    if settings.BACKEND_PORT:
-        backend_url = f"http://{settings.BACKEND_HOST}:{settings.BACKEND_PORT}"
-    else:
-        backend_url = f"http://{settings.BACKEND_HOST}"
-
     # 确保路径以 / 开头
     if not path.startswith("/"):
         path = "/" + path
 
-    return f"{backend_url}{path}"
+    return f"{get_backend_url()}{path}"
+
+
+@lru_cache(maxsize=1)
+def get_backend_url() -> str:
+    """
+    从配置获取后端地址（进程内缓存，配置在进程生命周期内不变）
+
+    与 V1 的 schemas._get_base_url 不同：未配置 BACKEND_PORT 时不补默认端口（V2 既有的 URL 格式）
+    """
+    settings = get_settings()
+    if settings.BACKEND_PORT:
+        return f"http://{settings.BACKEND_HOST}:{settings.BACKEND_PORT}"
+    return f"http://{settings.BACKEND_HOST}"
 
 
 # ============ 请求/响应模型 ============
@@ -178,20 +273,21 @@ async def process_image(
         task_id = str(uuid.uuid4())
         ext = ".png"
         result_filename = f"{task_id}_result{ext}"
-        request.output_path = os.path.join(RESULT_DIR, result_filename)
+        request.output_path = f"{RESULT_DIR}/{result_filename}"
 
     try:
         # 执行图片处理
-        result = process_image_with_gemini(
+        result = await run_gemini(
             image_path=request.image_path,
             output_path=request.output_path,
             custom_prompt=request.custom_prompt,
+            prompt_mode=request.prompt_mode,
             timeout_seconds=request.timeout_seconds,
             aspect_ratio=request.aspect_ratio,
             image_size=request.image_size
         )
 
-        logger.info(f"用户 {current_user.id} 图片处理成功: {request.image_path}")
+        logger.info("用户 %s 图片处理成功: %s", current_user.id, request.image_path)
 
         return ProcessResponse(
             success=result["success"],
@@ -201,10 +297,10 @@ async def process_image(
         )
 
     except ImageGenV2Error as e:
-        logger.error(f"图片处理失败: {e.message}")
+        logger.error("图片处理失败: %s", e.message)
         raise image_processing_failed_error(detail=e.message)
     except Exception as e:
-        logger.error(f"图片处理异常: {str(e)}", exc_info=True)
+        logger.error("图片处理异常: %s", e, exc_info=True)
         raise internal_error_error(detail=f"图片处理失败: {str(e)}")
 
 
@@ -213,7 +309,7 @@ async def process_upload(
     file: UploadFile = File(...),
     custom_prompt: Optional[str] = Form(None),
     prompt_mode: str = Form("merge"),
-    timeout_seconds: int = Form(180),
+    timeout_seconds: int = Form(180, ge=30, le=600),
     aspect_ratio: str = Form("1:1"),
     image_size: str = Form("1K"),
     current_user: User = Depends(get_current_user),
@@ -224,6 +320,9 @@ async def process_upload(
 
     上传图片后立即处理，生成白底图
 
+    连接会一直保持到 Gemini 返回（最长 timeout_seconds），期间占用一个请求槽位；
+    批量或高并发场景请使用 POST /api/v2/tasks/async（202 立即返回任务ID）
+
     - 需要用户认证
     - 支持的最大图片大小: 10MB
     - 支持的图片格式: JPEG, PNG, WebP, TIFF
@@ -232,45 +331,35 @@ async def process_upload(
     - 自动保存任务记录到数据库
     - 生成图片名称使用任务ID
     """
-    logger.info(f"收到上传请求: filename={file.filename}, content_type={file.content_type}")
-    logger.info(f"生成参数: aspect_ratio={aspect_ratio}, image_size={image_size}")
+    logger.info("收到上传请求: filename=%s, content_type=%s", file.filename, file.content_type)
+    logger.info("生成参数: aspect_ratio=%s, image_size=%s", aspect_ratio, image_size)
 
     # 验证文件类型
-    # 允许常见图片格式，包括浏览器可能发送的各种变体
-    allowed_types = {
-        'image/jpeg', 'image/jpg',
-        'image/png',
-        'image/webp',
-        'image/tiff', 'image/tif',
-        'image/heic', 'image/heif',
-        'application/octet-stream'  # 某些浏览器可能发送这个
-    }
     content_type = file.content_type or ''
-    logger.info(f"验证文件类型: {content_type} (允许: {allowed_types})")
+    logger.debug("验证文件类型: %s", content_type)
 
-    # 如果不在允许列表中，尝试基于扩展名判断
-    if content_type not in allowed_types:
-        filename = file.filename or ''
-        ext = filename.lower().split('.')[-1] if '.' in filename else ''
-        image_extensions = {'jpg', 'jpeg', 'png', 'webp', 'tiff', 'tif', 'heic', 'heif'}
+    # 获取文件扩展名（保存用扩展名 + 类型判断用的小写扩展名）
+    ext, ext_lower = split_file_ext(file.filename)
 
-        if ext in image_extensions:
-            logger.info(f"基于扩展名 {ext} 接受文件")
+    # 如果不在允许列表中，尝试基于扩展名判断
+    if content_type not in ALLOWED_UPLOAD_TYPES:
+        if ext_lower in ALLOWED_IMAGE_EXTENSIONS:
+            logger.info("基于扩展名 %s 接受文件", ext_lower)
         else:
-            logger.warning(f"不支持的文件类型: {content_type}, 扩展名: {ext}")
+            logger.warning("不支持的文件类型: %s, 扩展名: %s", content_type, ext_lower)
             raise invalid_image_format_error(content_type=content_type)
 
-    # 获取文件扩展名
-    ext = os.path.splitext(file.filename or '.jpg')[1] or '.jpg'
+    # 检查文件大小（最大10MB）
+    check_upload_size(file)
 
     # 检查用户积分是否足够
     if current_user.credits < 1:
-        logger.warning(f"用户 {current_user.id} 积分不足: {current_user.credits}")
+        logger.warning("用户 %s 积分不足: %s", current_user.id, current_user.credits)
         raise credits_insufficient_error()
 
     # 扣除积分
     current_user.credits -= 1
-    logger.info(f"扣除用户 {current_user.id} 积分，剩余: {current_user.credits}")
+    logger.info("扣除用户 %s 积分，剩余: %s", current_user.id, current_user.credits)
 
     # 创建数据库任务记录（先生成任务记录获取ID）
     db_task = GenerationTask(
@@ -284,39 +373,32 @@ async def process_upload(
         error_message=None
     )
     db.add(db_task)
-    db.commit()
-    db.refresh(db_task)
+    # flush 获取任务ID，路径与任务记录在同一事务中提交
+    db.flush()
     db_task_id = db_task.id
 
-    logger.info(f"创建任务记录: task_id={db_task_id}")
-
     # 使用任务ID生成文件名
     original_filename = f"{db_task_id}_original{ext}"
     result_filename = f"{db_task_id}_result.png"
 
-    original_path = os.path.join(UPLOAD_DIR, original_filename)
-    result_path = os.path.join(RESULT_DIR, result_filename)
+    original_path = f"{UPLOAD_DIR}/{original_filename}"
+    result_path = f"{RESULT_DIR}/{result_filename}"
 
-    # 更新数据库中的路径
     db_task.original_image_url = original_path
     db.commit()
 
+    logger.info("创建任务记录: task_id=%s", db_task_id)
+
     try:
         # 保存上传的文件
-        logger.info(f"开始保存文件: {original_path}")
-        async with aiofiles.open(original_path, "wb") as f:
-            content = await file.read()
-            logger.info(f"文件读取完成，大小: {len(content)} 字节")
-            # 检查文件大小（最大10MB）
-            if len(content) > 10 * 1024 * 1024:
-                raise image_too_large_error(size_mb=len(content) / (1024 * 1024), max_mb=10)
-            await f.write(content)
-        logger.info(f"文件保存完成: {original_path}")
+        logger.info("开始保存文件: %s", original_path)
+        file_size = await save_upload_file(file, original_path)
+        logger.info("文件保存完成: %s, 大小: %s 字节", original_path, file_size)
 
         # 执行图片处理（传递宽高比和分辨率参数）
-        logger.info(f"开始调用 Gemini API...")
-        logger.info(f"提示词模式: {prompt_mode}, custom_prompt: {custom_prompt[:50] if custom_prompt else '空'}...")
-        result = process_image_with_gemini(
+        logger.info("开始调用 Gemini API...")
+        logger.info("提示词模式: %s, custom_prompt: %.50s...", prompt_mode, custom_prompt or '空')
+        result = await run_gemini(
             image_path=original_path,
             output_path=result_path,
             custom_prompt=custom_prompt,
@@ -326,8 +408,11 @@ async def process_upload(
             image_size=image_size
         )
 
-        # 更新数据库记录
+        # 更新数据库记录（结果字段与状态在同一次提交中写入）
         db_task.status = TaskStatus.COMPLETED
+        db_task.result_image_url = result_path
+        db_task.progress = 100
+        db_task.elapsed_time = result.get("elapsed_time")
         db.commit()
 
         # WebSocket 推送任务完成
@@ -341,7 +426,7 @@ async def process_upload(
             elapsed_time=result.get("elapsed_time")
         )
 
-        logger.info(f"用户 {current_user.id} 任务 {db_task_id} 处理成功: {original_filename}")
+        logger.info("用户 %s 任务 %s 处理成功: %s", current_user.id, db_task_id, original_filename)
 
         return ProcessResponse(
             success=True,
@@ -363,7 +448,7 @@ async def process_upload(
         )
         raise
     except ImageGenV2Error as e:
-        logger.error(f"图片处理失败: {e.message}")
+        logger.error("图片处理失败: %s", e.message)
         db_task.status = TaskStatus.FAILED
         db_task.error_message = e.message
         db.commit()
@@ -377,7 +462,7 @@ async def process_upload(
         raise image_processing_failed_error(detail=e.message)
     except Exception as e:
         error_msg = str(e)
-        logger.error(f"图片处理异常: {error_msg}", exc_info=True)
+        logger.error("图片处理异常: %s", error_msg, exc_info=True)
         db_task.status = TaskStatus.FAILED
         db_task.error_message = error_msg
         db.commit()
@@ -389,6 +474,9 @@ async def process_upload(
             error_message=error_msg
         )
         raise internal_error_error(detail=f"处理失败: {error_msg}")
+    finally:
+        # 通知 SSE 等待方任务已结束
+        set_task_event(db_task_id)
 
 
 @router.get("/prompt/preview", response_model=PromptPreviewResponse)
@@ -401,6 +489,17 @@ def preview_prompt_text(
     - 需要用户认证
     - 返回当前使用的 Agent 提示词
     """
+    return get_prompt_preview_response()
+
+
+@lru_cache(maxsize=1)
+def get_prompt_preview_response() -> PromptPreviewResponse:
+    """
+    构建提示词预览响应（进程内缓存）
+
+    Agent 提示词在进程生命周期内不变，提示词更新后调用
+    get_prompt_preview_response.cache_clear() 失效
+    """
     prompt = get_agent_prompt()
 
     return PromptPreviewResponse(
@@ -427,7 +526,16 @@ def get_generation_config(current_user: User = Depends(get_current_user)):
     - 需要用户认证
     - 返回支持的宽高比和分辨率列表
     """
-    from app.config import get_settings
+    return get_generation_config_response()
+
+
+@lru_cache(maxsize=1)
+def get_generation_config_response() -> GenerationConfigResponse:
+    """
+    构建生图配置响应（进程内缓存）
+
+    配置来自 get_settings()，同样在进程生命周期内不变
+    """
     settings = get_settings()
 
     return GenerationConfigResponse(
@@ -440,22 +548,65 @@ def get_generation_config(current_user: User = Depends(get_current_user)):
 
 # ============ 任务历史模型 ============
 
-class V2TaskHistoryItem(BaseModel):
-    """V2任务历史项"""
+# 状态枚举 -> 字符串；status 列从数据库读出是 str，也能命中（TaskStatus 是 str 枚举）
+_STATUS_STR = {s: s.value for s in TaskStatus}
+
+@dataclass(slots=True)
+class V2TaskHistoryItem:
+    """
+    V2任务历史项
+
+    数据来自刚查询出的数据库记录，无需 pydantic 校验；
+    orjson 可直接序列化 dataclass
+    """
     id: int
     user_id: int
-    original_image_url: Optional[str] = None
-    result_image_url: Optional[str] = None
     status: str
     credits_used: int
     width: int
     height: int
     created_at: str
+    original_image_url: Optional[str] = None
+    result_image_url: Optional[str] = None
     elapsed_time: Optional[float] = None
     error_message: Optional[str] = None
     error_code: Optional[str] = None
     user_action: Optional[str] = None
 
+    @classmethod
+    def from_task(cls, task: GenerationTask) -> "V2TaskHistoryItem":
+        """由 GenerationTask ORM 对象构建"""
+        created_at = task.created_at
+        return cls(
+            id=task.id,
+            user_id=task.user_id,
+            original_image_url=make_image_url(task.original_image_url),
+            result_image_url=make_image_url(task.result_image_url),
+            status=_STATUS_STR.get(task.status, task.status),
+            credits_used=task.credits_used,
+            width=task.width,
+            height=task.height,
+            created_at=created_at.isoformat() if created_at else "",
+            elapsed_time=task.elapsed_time,
+            error_message=task.error_message,
+        )
+
+
+# V2TaskHistoryItem 实际用到的列，查询时只加载这些列
+_HISTORY_ITEM_COLUMNS = load_only(
+    GenerationTask.id,
+    GenerationTask.user_id,
+    GenerationTask.original_image_url,
+    GenerationTask.result_image_url,
+    GenerationTask.status,
+    GenerationTask.credits_used,
+    GenerationTask.width,
+    GenerationTask.height,
+    GenerationTask.created_at,
+    GenerationTask.elapsed_time,
+    GenerationTask.error_message,
+)
+
 
 class V2TaskHistoryResponse(BaseModel):
     """V2任务历史响应"""
@@ -479,9 +630,9 @@ def get_v2_task_history(
     - 按创建时间降序排列
     - 实时反映任务状态
     """
-    from sqlalchemy import desc
+    from sqlalchemy import desc, func
 
-    query = db.query(GenerationTask).filter(
+    query = db.query(GenerationTask).options(_HISTORY_ITEM_COLUMNS).filter(
         GenerationTask.user_id == current_user.id
     )
 
@@ -489,30 +640,16 @@ def get_v2_task_history(
         query = query.filter(GenerationTask.status == status_filter)
 
     tasks = query.order_by(desc(GenerationTask.created_at)).offset(skip).limit(limit).all()
-    total = query.count()
-
-    # 刷新数据库会话，确保获取最新状态
-    db.expire_all()
-
-    return V2TaskHistoryResponse(
-        tasks=[
-            V2TaskHistoryItem(
-                id=task.id,
-                user_id=task.user_id,
-                original_image_url=make_image_url(task.original_image_url),
-                result_image_url=make_image_url(task.result_image_url),
-                status=task.status.value if hasattr(task.status, 'value') else task.status,
-                credits_used=task.credits_used,
-                width=task.width,
-                height=task.height,
-                created_at=task.created_at.isoformat() if task.created_at else "",
-                elapsed_time=task.elapsed_time,
-                error_message=task.error_message,
-            )
-            for task in tasks
-        ],
-        total=total
-    )
+    # 单独计数而非 COUNT(*) OVER ()：窗口函数需要 MySQL 8.0+，部署文档支持 5.7；
+    # (user_id, created_at) / (user_id, status, created_at) 索引让这次计数只扫描索引
+    total = query.with_entities(func.count(GenerationTask.id)).order_by(None).scalar()
+
+    # 直接返回 ORJSONResponse，跳过 FastAPI 按 response_model 的校验和序列化
+    # （response_model 仍保留用于 OpenAPI 文档）
+    return ORJSONResponse({
+        "tasks": [V2TaskHistoryItem.from_task(task) for task in tasks],
+        "total": total
+    })
 
 
 @router.get("/tasks/{task_id}", response_model=V2TaskHistoryItem)
@@ -527,7 +664,7 @@ def get_v2_task_detail(
     - 需要用户认证
     - 只能查看自己的任务
     """
-    task = db.query(GenerationTask).filter(
+    task = db.query(GenerationTask).options(_HISTORY_ITEM_COLUMNS).filter(
         GenerationTask.id == task_id,
         GenerationTask.user_id == current_user.id
     ).first()
@@ -535,18 +672,44 @@ def get_v2_task_detail(
     if not task:
         raise task_not_found_error(task_id=task_id)
 
-    return V2TaskHistoryItem(
-        id=task.id,
-        user_id=task.user_id,
-        original_image_url=make_image_url(task.original_image_url),
-        result_image_url=make_image_url(task.result_image_url),
-        status=task.status.value if hasattr(task.status, 'value') else task.status,
-        credits_used=task.credits_used,
-        width=task.width,
-        height=task.height,
-        created_at=task.created_at.isoformat() if task.created_at else "",
-        error_message=task.error_message,
-    )
+    return V2TaskHistoryItem.from_task(task)
+
+
+@router.get("/tasks/{task_id}/download", response_class=FileResponse)
+def download_v2_task_result(
+    task_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    下载V2任务结果图片
+
+    - 需要用户认证
+    - 只能下载自己的任务
+    - 由 FileResponse 直接发送文件（服务器支持时走 sendfile 零拷贝），不在 Python 中读入整张图片
+    """
+    task = db.query(GenerationTask).options(
+        load_only(GenerationTask.id, GenerationTask.status, GenerationTask.result_image_url)
+    ).filter(
+        GenerationTask.id == task_id,
+        GenerationTask.user_id == current_user.id
+    ).first()
+
+    if not task:
+        raise task_not_found_error(task_id=task_id)
+
+    if task.status != TaskStatus.COMPLETED or not task.result_image_url:
+        raise validation_error_error(
+            message="任务尚未完成，暂无可下载的结果",
+            details={"task_id": task_id, "status": task.status}
+        )
+
+    result_path = Path(task.result_image_url)
+    if not result_path.is_file():
+        logger.warning("[Task %s] 结果文件不存在: %s", task_id, task.result_image_url)
+        raise task_not_found_error(task_id=task_id)
+
+    return FileResponse(result_path, media_type="image/png", filename=result_path.name)
 
 
 # ============ 异步任务模型 ============
@@ -570,6 +733,70 @@ class TaskStatusResponse(BaseModel):
     error_message: Optional[str] = None
 
 
+# ============ Gemini 并发控制 ============
+
+# 限制同时进行的 Gemini 调用数量，突发请求在此排队，避免上游限流和内存暴涨
+_gemini_semaphore = asyncio.Semaphore(get_settings().GEMINI_CONCURRENCY)
+
+
+async def run_gemini(
+    image_path: str,
+    output_path: str,
+    custom_prompt: Optional[str] = None,
+    prompt_mode: str = "merge",
+    timeout_seconds: int = 180,
+    aspect_ratio: str = "1:1",
+    image_size: str = "1K",
+) -> Dict[str, Any]:
+    """
+    执行 process_image_with_gemini_async
+
+    Gemini 调用耗时 30-180 秒，通过 SDK 异步客户端等待，不占用线程池；
+    并发数受 _gemini_semaphore 限制，超出的请求排队等待
+    """
+    queued_at = time.monotonic()
+    async with _gemini_semaphore:
+        logger.info("[QUEUE] %s 排队等待 %.2f秒", image_path, time.monotonic() - queued_at)
+        return await process_image_with_gemini_async(
+            image_path=image_path,
+            output_path=output_path,
+            custom_prompt=custom_prompt,
+            prompt_mode=prompt_mode,
+            timeout_seconds=timeout_seconds,
+            aspect_ratio=aspect_ratio,
+            image_size=image_size
+        )
+
+
+# ============ 任务完成事件（SSE 推送） ============
+
+# task_id -> asyncio.Event，后台任务结束（完成或失败）时触发
+_task_events: Dict[int, asyncio.Event] = {}
+
+# SSE 心跳间隔（秒），防止代理因空闲断开连接
+SSE_HEARTBEAT_SECONDS = 15
+
+# SSE 连接最长保持时间（秒），超过后关闭，由客户端重连或改用轮询
+SSE_MAX_LIFETIME_SECONDS = 900
+
+_FINISHED_STATUSES = frozenset({TaskStatus.COMPLETED.value, TaskStatus.FAILED.value})
+
+
+def get_task_event(task_id: int) -> asyncio.Event:
+    """获取（或创建）任务的完成事件"""
+    event = _task_events.get(task_id)
+    if event is None:
+        event = _task_events[task_id] = asyncio.Event()
+    return event
+
+
+def set_task_event(task_id: int) -> None:
+    """唤醒所有等待该任务结束的 SSE 连接"""
+    event = _task_events.pop(task_id, None)
+    if event is not None:
+        event.set()
+
+
 # ============ 后台任务处理 ============
 
 async def process_task_background(
@@ -588,13 +815,13 @@ async def process_task_background(
     """
     db_session = None
     user_id = None
-    logger.info(f"[START] [Task {task_id}] ========== 开始处理后台任务 ==========")
-    logger.info(f"[PATH] [Task {task_id}] 文件路径 - 输入: {original_path}, 输出: {result_path}")
-    logger.info(f"[PARAM] [Task {task_id}] 比例: {aspect_ratio}, 尺寸: {image_size}")
+    logger.info("[START] [Task %s] ========== 开始处理后台任务 ==========", task_id)
+    logger.info("[PATH] [Task %s] 文件路径 - 输入: %s, 输出: %s", task_id, original_path, result_path)
+    logger.info("[PARAM] [Task %s] 比例: %s, 尺寸: %s", task_id, aspect_ratio, image_size)
 
     async def update_progress(progress: int, estimated_remaining: int = None):
         """推送进度更新并更新数据库"""
-        logger.info(f"[WS_PUSH] [Task {task_id}] 准备推送进度: {progress}%, user_id={user_id}")
+        logger.info("[WS_PUSH] [Task %s] 准备推送进度: %s%%, user_id=%s", task_id, progress, user_id)
 
         # 更新数据库progress字段
         if db_session:
@@ -603,9 +830,9 @@ async def process_task_background(
                 if task_obj:
                     task_obj.progress = progress
                     db_session.commit()
-                    logger.info(f"[DB] [Task {task_id}] 数据库进度已更新: {progress}%")
+                    logger.info("[DB] [Task %s] 数据库进度已更新: %s%%", task_id, progress)
             except Exception as db_error:
-                logger.error(f"[FAILED] [Task {task_id}] 数据库进度更新失败: {db_error}")
+                logger.error("[FAILED] [Task %s] 数据库进度更新失败: %s", task_id, db_error)
                 db_session.rollback()
 
         # WebSocket推送
@@ -618,44 +845,43 @@ async def process_task_background(
                     progress=progress,
                     estimated_remaining=estimated_remaining
                 )
-                logger.info(f"[SUCCESS] [Task {task_id}] 进度推送成功: {progress}%")
+                logger.info("[SUCCESS] [Task %s] 进度推送成功: %s%%", task_id, progress)
             except Exception as ws_error:
-                logger.error(f"[FAILED] [Task {task_id}] 进度推送失败: {ws_error}", exc_info=True)
+                logger.error("[FAILED] [Task %s] 进度推送失败: %s", task_id, ws_error, exc_info=True)
         else:
-            logger.warning(f"[WARN]  [Task {task_id}] user_id 为空，无法推送进度")
+            logger.warning("[WARN]  [Task %s] user_id 为空，无法推送进度", task_id)
 
     try:
         # 创建独立的数据库 Session
-        logger.info(f"[Task {task_id}] 创建 SessionLocal")
+        logger.info("[Task %s] 创建 SessionLocal", task_id)
         db_session = SessionLocal()
 
         # 更新状态为 PROCESSING
-        logger.info(f"[Task {task_id}] 查询数据库任务")
+        logger.info("[Task %s] 查询数据库任务", task_id)
         task = db_session.query(GenerationTask).filter(GenerationTask.id == task_id).first()
         if task:
             user_id = task.user_id
-            logger.info(f"[Task {task_id}] 找到任务, user_id={user_id}, 状态={task.status}")
+            logger.info("[Task %s] 找到任务, user_id=%s, 状态=%s", task_id, user_id, task.status)
             task.status = TaskStatus.PROCESSING
             db_session.commit()
-            logger.info(f"[Task {task_id}] 状态已更新为 PROCESSING")
+            logger.info("[Task %s] 状态已更新为 PROCESSING", task_id)
         else:
-            logger.error(f"[Task {task_id}] 未找到任务记录!")
+            logger.error("[Task %s] 未找到任务记录!", task_id)
             return
 
         # WebSocket 推送任务开始处理
         await update_progress(0, 30)
 
-        logger.info(f"[PROCESS] [Task {task_id}] 后台任务开始处理")
+        logger.info("[PROCESS] [Task %s] 后台任务开始处理", task_id)
 
         # 推送 30% 进度（等待一小段时间，让前端UI有时间更新）
         await asyncio.sleep(0.5)  # 500ms延迟
         await update_progress(30, 20)
 
-        # 在线程池中执行图片处理（避免阻塞事件循环）
-        logger.info(f"[API_CALL] [Task {task_id}] 开始调用 process_image_with_gemini")
-        logger.info(f"[PROMPT] [Task {task_id}] 提示词模式: {prompt_mode}, custom_prompt: {custom_prompt[:50] if custom_prompt else '空'}...")
-        result = await asyncio.to_thread(
-            process_image_with_gemini,
+        # 经 Gemini 并发信号量排队后通过 SDK 异步客户端调用，等待期间不占用线程
+        logger.info("[API_CALL] [Task %s] 开始调用 process_image_with_gemini_async", task_id)
+        logger.info("[PROMPT] [Task %s] 提示词模式: %s, custom_prompt: %.50s...", task_id, prompt_mode, custom_prompt or '空')
+        result = await run_gemini(
             image_path=original_path,
             output_path=result_path,
             custom_prompt=custom_prompt,
@@ -664,7 +890,7 @@ async def process_task_background(
             aspect_ratio=aspect_ratio,
             image_size=image_size
         )
-        logger.info(f"[API_DONE] [Task {task_id}] process_image_with_gemini 完成, result={result}")
+        logger.info("[API_DONE] [Task %s] process_image_with_gemini_async 完成, 耗时: %s秒", task_id, result.get("elapsed_time"))
 
         # 推送 60% 进度（添加延迟）
         await asyncio.sleep(0.3)  # 300ms延迟
@@ -694,11 +920,11 @@ async def process_task_background(
                 elapsed_time=result.get("elapsed_time")
             )
 
-        logger.info(f"后台任务完成: task_id={task_id}")
+        logger.info("后台任务完成: task_id=%s", task_id)
 
     except Exception as e:
         error_msg = str(e)
-        logger.error(f"后台任务失败: task_id={task_id}, error={error_msg}", exc_info=True)
+        logger.error("后台任务失败: task_id=%s, error=%s", task_id, error_msg, exc_info=True)
 
         # 使用独立的数据库连接来更新失败状态
         db_session_for_error = None
@@ -714,7 +940,7 @@ async def process_task_background(
                 user = db_session_for_error.query(User).filter(User.id == user_id).first()
                 if user:
                     user.credits += 1
-                    logger.info(f"任务失败，退还用户 {user_id} 积分，当前积分: {user.credits}")
+                    logger.info("任务失败，退还用户 %s 积分，当前积分: %s", user_id, user.credits)
 
                 db_session_for_error.commit()
 
@@ -727,7 +953,7 @@ async def process_task_background(
                         error_message=error_msg
                     )
         except Exception as db_error:
-            logger.error(f"更新失败任务状态时出错: {db_error}", exc_info=True)
+            logger.error("更新失败任务状态时出错: %s", db_error, exc_info=True)
         finally:
             if db_session_for_error:
                 db_session_for_error.close()
@@ -736,16 +962,18 @@ async def process_task_background(
         # 关闭 Session
         if db_session:
             db_session.close()
+        # 通知 SSE 等待方任务已结束
+        set_task_event(task_id)
 
 
 # ============ 异步任务 API ============
 
-@router.post("/tasks/async", response_model=AsyncTaskResponse)
+@router.post("/tasks/async", response_model=AsyncTaskResponse, status_code=202)
 async def create_async_task(
     file: UploadFile = File(...),
     custom_prompt: Optional[str] = Form(None),
     prompt_mode: str = Form("merge"),
-    timeout_seconds: int = Form(180),
+    timeout_seconds: int = Form(180, ge=30, le=600),
     aspect_ratio: str = Form("1:1"),
     image_size: str = Form("1K"),
     current_user: User = Depends(get_current_user),
@@ -754,35 +982,35 @@ async def create_async_task(
     """
     创建异步任务（立即返回，后台处理）
 
-    上传图片后立即创建任务并返回任务ID，后台异步处理生成白底图。
+    上传图片后立即创建任务并返回任务ID（HTTP 202 Accepted），后台异步处理生成白底图。
 
     - 需要用户认证
     - 支持的最大图片大小: 10MB
     - 支持的图片格式: JPEG, PNG, WebP, TIFF
-    - 返回任务ID后可轮询 /api/v2/tasks/{task_id}/status 获取状态
+    - 返回任务ID后可订阅 /api/v2/tasks/{task_id}/events 等待结果，
+      或轮询 /api/v2/tasks/{task_id}/status 获取状态
     """
     # 验证文件类型
-    allowed_types = {'image/jpeg', 'image/jpg', 'image/png', 'image/webp', 'image/tiff', 'image/tif', 'image/heic', 'image/heif'}
     content_type = file.content_type or ''
 
-    if content_type not in allowed_types:
-        filename = file.filename or ''
-        ext = filename.lower().split('.')[-1] if '.' in filename else ''
-        image_extensions = {'jpg', 'jpeg', 'png', 'webp', 'tiff', 'tif', 'heic', 'heif'}
-        if ext not in image_extensions:
+    # 获取文件扩展名（保存用扩展名 + 类型判断用的小写扩展名）
+    ext, ext_lower = split_file_ext(file.filename)
+
+    if content_type not in ALLOWED_IMAGE_TYPES:
+        if ext_lower not in ALLOWED_IMAGE_EXTENSIONS:
             raise invalid_image_format_error(content_type=content_type)
 
-    # 获取文件扩展名
-    ext = os.path.splitext(file.filename or '.jpg')[1] or '.jpg'
+    # 检查文件大小（最大10MB）
+    check_upload_size(file)
 
     # 检查用户积分是否足够
     if current_user.credits < 1:
-        logger.warning(f"用户 {current_user.id} 积分不足: {current_user.credits}")
+        logger.warning("用户 %s 积分不足: %s", current_user.id, current_user.credits)
         raise credits_insufficient_error()
 
     # 扣除积分
     current_user.credits -= 1
-    logger.info(f"扣除用户 {current_user.id} 积分，剩余: {current_user.credits}")
+    logger.info("扣除用户 %s 积分，剩余: %s", current_user.id, current_user.credits)
 
     # 创建数据库任务记录（状态为 PENDING）
     db_task = GenerationTask(
@@ -796,30 +1024,25 @@ async def create_async_task(
         error_message=None
     )
     db.add(db_task)
-    db.commit()
-    db.refresh(db_task)
+    # flush 获取任务ID，路径与任务记录在同一事务中提交
+    db.flush()
     task_id = db_task.id
 
-    logger.info(f"📝 [Task {task_id}] 创建异步任务 - user_id={current_user.id}, user={current_user.username}")
-
     # 使用任务ID生成文件名
     original_filename = f"{task_id}_original{ext}"
     result_filename = f"{task_id}_result.png"
 
-    original_path = os.path.join(UPLOAD_DIR, original_filename)
-    result_path = os.path.join(RESULT_DIR, result_filename)
+    original_path = f"{UPLOAD_DIR}/{original_filename}"
+    result_path = f"{RESULT_DIR}/{result_filename}"
 
-    # 更新数据库中的路径
     db_task.original_image_url = original_path
     db.commit()
 
+    logger.info("📝 [Task %s] 创建异步任务 - user_id=%s, user=%s", task_id, current_user.id, current_user.username)
+
     try:
         # 保存上传的文件
-        async with aiofiles.open(original_path, "wb") as f:
-            content = await file.read()
-            if len(content) > 10 * 1024 * 1024:
-                raise image_too_large_error(size_mb=len(content) / (1024 * 1024), max_mb=10)
-            await f.write(content)
+        await save_upload_file(file, original_path)
 
         # 启动后台任务
         asyncio.create_task(
@@ -835,7 +1058,7 @@ async def create_async_task(
             )
         )
 
-        logger.info(f"[SUCCESS] [Task {task_id}] 异步任务已启动并加入事件循环")
+        logger.info("[SUCCESS] [Task %s] 异步任务已启动并加入事件循环", task_id)
 
         return AsyncTaskResponse(
             task_id=task_id,
@@ -868,8 +1091,6 @@ def get_task_status(
     - 只能查询自己的任务
     - 返回任务当前状态和结果（如果已完成）
     """
-    from datetime import datetime, timezone
-
     task = db.query(GenerationTask).filter(
         GenerationTask.id == task_id,
         GenerationTask.user_id == current_user.id
@@ -881,6 +1102,13 @@ def get_task_status(
     # 刷新task对象以确保获取最新的progress值
     db.refresh(task)
 
+    return build_task_status_response(task)
+
+
+def build_task_status_response(task: GenerationTask) -> TaskStatusResponse:
+    """根据数据库任务记录构建状态响应"""
+    from datetime import datetime, timezone
+
     # 计算预估剩余时间
     estimated_remaining = None
     if task.status in [TaskStatus.PENDING, TaskStatus.PROCESSING]:
@@ -898,10 +1126,92 @@ def get_task_status(
 
     return TaskStatusResponse(
         task_id=task.id,
-        status=task.status.value if hasattr(task.status, 'value') else task.status,
+        # status 列为 String，TaskStatus 是 str 子类，pydantic 会直接转为纯字符串
+        status=task.status,
         progress=task.progress if task.progress is not None else 0,  # 任务进度
         result_image_url=make_image_url(task.result_image_url) if task.result_image_url else None,
         elapsed_time=getattr(task, 'elapsed_time', None),
         estimated_remaining_seconds=estimated_remaining,
         error_message=task.error_message
     )
+
+
+@router.get("/tasks/{task_id}/events")
+async def stream_task_events(
+    task_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    订阅任务结果（Server-Sent Events）
+
+    - 需要用户认证
+    - 只能订阅自己的任务
+    - 连接保持到任务完成或失败，期间定时发送心跳注释并查库兜底
+    - 超过 SSE_MAX_LIFETIME_SECONDS 仍未结束时推送 timeout 事件后关闭
+    - 任务结束时推送一帧 TaskStatusResponse JSON 后关闭
+    - 轮询接口 /tasks/{task_id}/status 仍可作为降级方案
+    """
+    task = db.query(GenerationTask).filter(
+        GenerationTask.id == task_id,
+        GenerationTask.user_id == current_user.id
+    ).first()
+
+    if not task:
+        raise task_not_found_error(task_id=task_id)
+
+    # 先注册事件再重新读取状态，避免两者之间错过完成通知；
+    # 先结束当前事务，否则 REPEATABLE READ 下 refresh 读到的仍是旧快照
+    event = get_task_event(task_id)
+    db.rollback()
+    db.refresh(task)
+    if task.status in _FINISHED_STATUSES:
+        set_task_event(task_id)
+
+    def load_status() -> Optional[TaskStatusResponse]:
+        # 请求级 Session 在流式响应期间已关闭，使用独立的短生命周期 Session
+        db_session = SessionLocal()
+        try:
+            current = db_session.query(GenerationTask).filter(
+                GenerationTask.id == task_id
+            ).first()
+            return build_task_status_response(current) if current else None
+        finally:
+            db_session.close()
+
+    async def event_stream():
+        deadline = time.monotonic() + SSE_MAX_LIFETIME_SECONDS
+        response = None
+        while not event.is_set():
+            try:
+                await asyncio.wait_for(event.wait(), timeout=SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                # 兜底：同步接口或服务重启遗留的任务可能不会触发事件，心跳时直接查库
+                response = await asyncio.to_thread(load_status)
+                if response is None or response.status in _FINISHED_STATUSES:
+                    break
+                response = None
+                if time.monotonic() >= deadline:
+                    # 超过最长保持时间仍未结束，关闭连接，客户端可重连或改用轮询；
+                    # 只移除登记而不触发事件，其他订阅方不会被误唤醒
+                    if _task_events.get(task_id) is event:
+                        del _task_events[task_id]
+                    yield "event: timeout\ndata: {}\n\n"
+                    return
+                yield ": heartbeat\n\n"
+
+        # 查库发现任务已结束时，同时唤醒其他订阅方并清理 _task_events
+        set_task_event(task_id)
+
+        if response is None:
+            response = await asyncio.to_thread(load_status)
+        if response is None:
+            return
+
+        yield f"event: {response.status}\ndata: {response.model_dump_json()}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
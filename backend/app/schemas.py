@@ -2,12 +2,18 @@
 Pydantic 模型定义
 用于 API 请求和响应验证
 """
-from pydantic import BaseModel, EmailStr, field_validator, Field
-from typing import Optional
+from functools import lru_cache
+from pydantic import BaseModel, EmailStr, Field, computed_field
+from typing import Literal, Optional
 from datetime import datetime
+from app.config import get_settings
 from app.models import TaskStatus
 
 
+# 完整 URL 前缀（str.startswith 接受元组，一次调用完成判断），V2 路由的 make_image_url 共用
+URL_PREFIXES = ('http://', 'https://')
+
+
 def build_full_url(path: str | None) -> str | None:
     """
     构建完整的图片 URL
@@ -25,11 +31,26 @@ def build_full_url(path: str | None) -> str | None:
         return None
 
     # 如果已经是完整 URL，直接返回
-    if path.startswith('http://') or path.startswith('https://'):
+    if path.startswith(URL_PREFIXES):
         return path
 
-    # 导入配置获取服务器信息
-    from app.config import get_settings
+    # 确保 path 以 / 开头
+    if not path.startswith('/'):
+        path = '/' + path
+
+    return _get_base_url() + path
+
+
+@lru_cache(maxsize=1)
+def _get_base_url() -> str:
+    """
+    获取后端服务基础 URL（进程内缓存）
+
+    配置在进程生命周期内不变，只在第一次构建 URL 时读取。
+    V1 接口历来在未配置 BACKEND_PORT 时补默认端口 8001、把 127.0.0.1 统一为 localhost；
+    V2 的 generation_v2.get_backend_url 直接使用 BACKEND_HOST、不补端口。
+    两套接口已各自向前端返回这两种 URL，合并会改变其中一方的输出，因此保留各自的实现
+    """
     settings = get_settings()
 
     # 获取后端服务器地址和端口
@@ -39,15 +60,8 @@ def build_full_url(path: str | None) -> str | None:
 
     # 构建基础 URL
     if host in ('localhost', '127.0.0.1'):
-        base_url = f"http://localhost:{port}"
-    else:
-        base_url = f"http://{host}:{port}"
-
-    # 确保 path 以 / 开头
-    if not path.startswith('/'):
-        path = '/' + path
-
-    return f"{base_url}{path}"
+        return f"http://localhost:{port}"
+    return f"http://{host}:{port}"
 
 
 # ============ 用户相关 Schema ============
@@ -113,8 +127,9 @@ class TaskStatusResponse(BaseModel):
     progress: int = Field(0, ge=0, le=100)
     created_at: datetime
     updated_at: Optional[datetime] = None
-    original_image_url: Optional[str] = None
-    result_image_url: Optional[str] = None
+    # 存储数据库中的原始相对路径，完整 URL 只在序列化时由 computed_field 拼接
+    original_image_path: Optional[str] = Field(None, validation_alias='original_image_url', exclude=True)
+    result_image_path: Optional[str] = Field(None, validation_alias='result_image_url', exclude=True)
     error_message: Optional[str] = None
     width: int
     height: int
@@ -122,11 +137,39 @@ class TaskStatusResponse(BaseModel):
     is_timed_out: bool = False
     can_retry: bool = False
 
-    @field_validator('original_image_url', 'result_image_url', mode='before')
     @classmethod
-    def ensure_full_url(cls, v, info):
-        """确保图片 URL 是完整的"""
-        return build_full_url(v)
+    def from_task(cls, task) -> "TaskStatusResponse":
+        """
+        由 GenerationTask ORM 对象直接构建（跳过校验）
+
+        数据来自数据库，字段类型已由列定义保证，用 model_construct 省去逐字段校验
+        """
+        status = task.status
+        return cls.model_construct(
+            id=task.id,
+            status=status.value if isinstance(status, TaskStatus) else status,
+            progress=task.progress or 0,
+            created_at=task.created_at,
+            updated_at=task.updated_at,
+            original_image_path=task.original_image_url,
+            result_image_path=task.result_image_url,
+            error_message=task.error_message,
+            width=task.width,
+            height=task.height,
+            credits_used=task.credits_used,
+        )
+
+    @computed_field
+    @property
+    def original_image_url(self) -> Optional[str]:
+        """原图完整 URL"""
+        return build_full_url(self.original_image_path)
+
+    @computed_field
+    @property
+    def result_image_url(self) -> Optional[str]:
+        """结果图完整 URL"""
+        return build_full_url(self.result_image_path)
 
     class Config:
         from_attributes = True
@@ -197,11 +240,15 @@ class ErrorResponse(BaseModel):
 
 # ============ 图片生成请求 Schema ============
 
+# 支持的宽高比（与 Settings.SUPPORTED_ASPECT_RATIOS 一致），Literal 校验只是一次集合查找
+AspectRatio = Literal["1:1", "2:3", "3:2", "3:4", "4:3", "4:5", "5:4", "9:16", "16:9", "21:9"]
+
+
 class ImageGenerationParams(BaseModel):
     """图片生成参数"""
     width: int = Field(1024, ge=100, le=4096, description="输出图片宽度")
     height: int = Field(1024, ge=100, le=4096, description="输出图片高度")
-    ratio: str = Field("1:1", pattern=r"^\d+:\d+$", description="宽高比")
+    ratio: AspectRatio = Field("1:1", description="宽高比")
 
 
 class GenerationResult(BaseModel):
@@ -0,0 +1,68 @@
+"""
+Gemini 公共组件
+V1（image_gen）和 V2（image_gen_v2）图片生成服务共用的客户端和输入图片处理
+"""
+import io
+import logging
+
+from PIL import Image
+
+from app.config import get_settings
+from google import genai
+from google.genai import types
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Gemini 客户端缓存
+_gemini_client = None
+
+# Gemini 可直接接收的输入图片格式，其余格式（如 TIFF）交给 SDK 转码
+GEMINI_INPUT_MIME_TYPES = frozenset({
+    "image/jpeg", "image/png", "image/webp", "image/heic", "image/heif",
+})
+
+
+def get_gemini_client():
+    """
+    获取 Gemini 客户端（单例模式）
+
+    Returns:
+        genai.Client: Gemini API 客户端
+    """
+    global _gemini_client
+
+    if _gemini_client is None:
+        _gemini_client = genai.Client(
+            api_key=settings.GEMINI_API_KEY,
+            http_options={"base_url": "https://aihubmix.com/gemini"},
+        )
+        logger.info("Gemini 客户端初始化完成")
+
+    return _gemini_client
+
+
+def load_input_image(image_path: str):
+    """
+    读取输入图片并构造发送给 Gemini 的图片部分
+
+    整个文件只读取一次；PIL 从内存中只解析文件头，像素数据按需解码。
+    Gemini 原生支持的格式直接发送原始字节；
+    传 PIL 图片时 SDK 会重新编码为 PNG/JPEG，既耗 CPU 又让 JPEG 再损失一次画质
+
+    Args:
+        image_path: 输入图片路径
+
+    Returns:
+        types.Part 或 PIL Image（不支持的格式交给 SDK 转码）
+    """
+    logger.info("加载图片...")
+    with open(image_path, "rb") as image_file:
+        input_bytes = image_file.read()
+    input_image = Image.open(io.BytesIO(input_bytes))
+    logger.info("图片加载完成，尺寸: %s", input_image.size)
+
+    mime_type = Image.MIME.get(input_image.format)
+    if mime_type in GEMINI_INPUT_MIME_TYPES:
+        return types.Part.from_bytes(data=input_bytes, mime_type=mime_type)
+    return input_image
@@ -2,14 +2,15 @@
 AI 图片生成服务
 提供背景去除和白底图生成功能，支持异步处理和错误恢复
 """
-import base64
 import logging
+import os
+import random
 import time
 from typing import Optional, Dict, Any
 from pathlib import Path
 
 from app.config import get_settings
-from google import genai
+from app.services.gemini_common import get_gemini_client, load_input_image
 from google.genai.errors import APIError
 
 logger = logging.getLogger(__name__)
@@ -17,6 +18,55 @@ logger = logging.getLogger(__name__)
 settings = get_settings()
 
 
+# 可重试错误的退避时间（秒），按重试次数取值，超出后使用最后一项
+RETRY_BACKOFF_SECONDS = (2, 4, 8, 16, 32)
+
+
+# 精细化白底图提示词（固定内容，模块加载时创建一次）
+WHITE_BG_PROMPT = """**第一阶段: 产品DNA精确提取**
+
+分析输入图像中服装类目，提取并锁定以下核心细节：
+- 面料材质、编织纹理、图案细节
+- 精确颜色（潘通色值）
+- 品牌logo或文字设计（位置、字体、大小完全一致）
+- 服装各部位几何形状、尺寸比例
+
+**第二阶段: 几何形态标准化重建**
+
+视角要求：
+- 正向对准产品中心的垂直视角
+- 电商标准展示图，不改变整体比例
+
+褶皱处理：
+- 消除拍摄导致的真实不规则褶皱
+- 重建为电商展示标准的平整形态
+- 严格保留面料的自然纹理
+
+结构约束：
+- 服装关键结构点（纽扣位置、缝线走向、口袋形状）与原图完全一致
+- 版型比例优先于褶皱消除
+
+**第三阶段: 电商化渲染**
+
+场景净化：
+- 100%纯白背景（RGB 255,255,255），无任何阴影反光
+- 移除所有非产品元素：模特、衣架、支撑物、阴影
+
+理想化渲染：
+- 均匀无影的全局光照，展示产品固有色
+- 基于锁定的产品DNA，渲染清晰平整的理想化面料质感
+
+**输出禁忌**：
+- 禁止改变产品类目、材质、颜色
+- 禁止添加任何装饰元素
+- 禁止添加标签、洗水标、尺码标、吊牌
+- 禁止出现阴影、反光、渐变背景
+- 禁止改变缝合线走向
+- 禁止调整纽扣/口袋/扣眼的数量和位置
+
+只输出处理后的图片，不要任何文字说明。"""
+
+
 class ImageGenerationError(Exception):
     """图片生成错误基类"""
 
@@ -60,15 +110,16 @@ def validate_image(image_path: str) -> bool:
     Raises:
         InvalidImageError: 图片无效
     """
-    path = Path(image_path)
-
-    if not path.exists():
+    # 一次 stat 同时判断存在性和大小
+    try:
+        size = os.stat(image_path).st_size
+    except FileNotFoundError:
         raise InvalidImageError(
             f"Image file not found: {image_path}",
             code="FILE_NOT_FOUND"
         )
 
-    if path.stat().st_size == 0:
+    if size == 0:
         raise InvalidImageError(
             f"Image file is empty: {image_path}",
             code="EMPTY_FILE"
@@ -76,9 +127,9 @@ def validate_image(image_path: str) -> bool:
 
     # 检查文件大小 (最大 10MB)
     max_size = 10 * 1024 * 1024
-    if path.stat().st_size > max_size:
+    if size > max_size:
         raise InvalidImageError(
-            f"Image file too large: {path.stat().st_size} bytes (max {max_size} bytes)",
+            f"Image file too large: {size} bytes (max {max_size} bytes)",
             code="FILE_TOO_LARGE"
         )
 
@@ -118,10 +169,10 @@ def remove_background_with_gemini(
     # 验证输入图片
     validate_image(image_path)
 
-    # 读取图片
+    # 读取图片（与 V2 共用：Gemini 支持的格式直接传原始字节，
+    # 其余格式如 TIFF 交给 SDK 转码，MIME 类型按文件内容识别而非扩展名）
     logger.info(f"Reading image from {image_path}")
-    with open(image_path, "rb") as image_file:
-        image_data = base64.b64encode(image_file.read()).decode("utf-8")
+    image_part = load_input_image(image_path)
 
     # 检查 API 密钥
     if not settings.GEMINI_API_KEY:
@@ -130,55 +181,8 @@ def remove_background_with_gemini(
             code="MISSING_API_KEY"
         )
 
-    # 创建 Gemini 客户端（使用 AIHubMix）
-    client = genai.Client(
-        api_key=settings.GEMINI_API_KEY,
-        http_options={"base_url": "https://aihubmix.com/gemini"},
-    )
-
-    # 精细化提示词
-    prompt = """**第一阶段: 产品DNA精确提取**
-
-分析输入图像中服装类目，提取并锁定以下核心细节：
-- 面料材质、编织纹理、图案细节
-- 精确颜色（潘通色值）
-- 品牌logo或文字设计（位置、字体、大小完全一致）
-- 服装各部位几何形状、尺寸比例
-
-**第二阶段: 几何形态标准化重建**
-
-视角要求：
-- 正向对准产品中心的垂直视角
-- 电商标准展示图，不改变整体比例
-
-褶皱处理：
-- 消除拍摄导致的真实不规则褶皱
-- 重建为电商展示标准的平整形态
-- 严格保留面料的自然纹理
-
-结构约束：
-- 服装关键结构点（纽扣位置、缝线走向、口袋形状）与原图完全一致
-- 版型比例优先于褶皱消除
-
-**第三阶段: 电商化渲染**
-
-场景净化：
-- 100%纯白背景（RGB 255,255,255），无任何阴影反光
-- 移除所有非产品元素：模特、衣架、支撑物、阴影
-
-理想化渲染：
-- 均匀无影的全局光照，展示产品固有色
-- 基于锁定的产品DNA，渲染清晰平整的理想化面料质感
-
-**输出禁忌**：
-- 禁止改变产品类目、材质、颜色
-- 禁止添加任何装饰元素
-- 禁止添加标签、洗水标、尺码标、吊牌
-- 禁止出现阴影、反光、渐变背景
-- 禁止改变缝合线走向
-- 禁止调整纽扣/口袋/扣眼的数量和位置
-
-只输出处理后的图片，不要任何文字说明。"""
+    # 复用进程内的 Gemini 客户端（使用 AIHubMix），避免每次调用重新建立连接
+    client = get_gemini_client()
 
     logger.info(f"Calling Gemini API with model gemini-3-pro-image-preview")
 
@@ -187,8 +191,8 @@ def remove_background_with_gemini(
         response = client.models.generate_content(
             model="gemini-3-pro-image-preview",
             contents=[
-                prompt,
-                {"inline_data": {"mime_type": "image/jpeg", "data": image_data}}
+                WHITE_BG_PROMPT,
+                image_part
             ],
         )
 
@@ -231,27 +235,28 @@ def remove_background_with_gemini(
         return result_path
 
     except APIError as e:
-        error_msg = f"Gemini API error: {str(e)}"
+        original_error = str(e)
+        error_msg = f"Gemini API error: {original_error}"
         logger.error(error_msg)
 
-        # 根据错误类型分类
-        if "RESOURCE_EXHAUSTED" in str(e) or "429" in str(e):
+        # 根据 HTTP 状态码 / gRPC 状态分类，不在错误文本里做子串匹配
+        if e.code == 429 or e.status == "RESOURCE_EXHAUSTED":
             raise RateLimitError(
                 "API rate limit exceeded. Please try again later.",
                 code="RATE_LIMIT",
-                details={"original_error": str(e)}
+                details={"original_error": original_error}
             )
-        elif "DEADLINE_EXCEEDED" in str(e) or "504" in str(e):
+        elif e.code == 504 or e.status == "DEADLINE_EXCEEDED":
             raise TimeoutExceededError(
                 "API request timed out",
                 code="API_TIMEOUT",
-                details={"original_error": str(e)}
+                details={"original_error": original_error}
             )
         else:
             raise ImageGenerationError(
                 error_msg,
                 code="API_ERROR",
-                details={"original_error": str(e)}
+                details={"original_error": original_error}
             )
 
     except TimeoutError as e:
@@ -339,8 +344,12 @@ def generate_white_bg_with_retry(
         except (RateLimitError, TimeoutExceededError) as e:
             # 这些错误可以重试
             last_error = e
-            wait_time = (attempt + 1) * 5  # 递增等待时间
-            logger.warning(f"Retryable error, waiting {wait_time}s before retry: {e}")
+            if attempt == max_retries:
+                # 最后一次尝试失败后不再等待
+                break
+            # 指数退避 + 随机抖动，避免多个任务同时重试再次触发限流
+            wait_time = RETRY_BACKOFF_SECONDS[min(attempt, len(RETRY_BACKOFF_SECONDS) - 1)] + random.uniform(0, 1)
+            logger.warning(f"Retryable error, waiting {wait_time:.1f}s before retry: {e}")
             time.sleep(wait_time)
 
         except APIKeyError:
@@ -2,45 +2,46 @@
 V2 图片生成服务
 基于 Gemini API 的服饰图生图功能，使用单一 Agent 提示词
 """
+import asyncio
 import base64
 import io
 import logging
+import os
 import time
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional, Dict, Any
 
-from PIL import Image, ImageOps
+import httpx
+from PIL import ExifTags, Image, ImageChops, ImageOps
 
 from app.config import get_settings
+from app.services.gemini_common import get_gemini_client, load_input_image
 from app.services.prompt_template import get_agent_prompt
-from google import genai
 from google.genai import types
 from google.genai.errors import APIError
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
-# Gemini 客户端缓存
-_gemini_client = None
+# 图生图模型；只有文本转图片才需要 image_config，图生图时 Gemini 会保持原图比例
+GEMINI_IMAGE_MODEL = "gemini-3-pro-image-preview"
+GEMINI_IMAGE_CONFIG = types.GenerateContentConfig(
+    response_modalities=['TEXT', 'IMAGE'],
+)
 
 
-def get_gemini_client():
+@lru_cache(maxsize=16)
+def gemini_image_config_with_timeout(timeout_seconds: int) -> types.GenerateContentConfig:
     """
-    获取 Gemini 客户端（单例模式）
+    带请求超时的生成配置（同步调用使用，按超时秒数缓存）
 
-    Returns:
-        genai.Client: Gemini API 客户端
+    SDK 的 HttpOptions.timeout 单位为毫秒，超时后 httpx 抛出 TimeoutException
     """
-    global _gemini_client
-
-    if _gemini_client is None:
-        _gemini_client = genai.Client(
-            api_key=settings.GEMINI_API_KEY,
-            http_options={"base_url": "https://aihubmix.com/gemini"},
-        )
-        logger.info("Gemini 客户端初始化完成")
-
-    return _gemini_client
+    return types.GenerateContentConfig(
+        response_modalities=['TEXT', 'IMAGE'],
+        http_options=types.HttpOptions(timeout=timeout_seconds * 1000),
+    )
 
 
 class ImageGenV2Error(Exception):
@@ -86,37 +87,77 @@ def validate_image(image_path: str) -> bool:
     Raises:
         InvalidImageError: 图片无效
     """
-    path = Path(image_path)
-    
-    if not path.exists():
+    # 一次 stat 同时判断存在性和大小
+    try:
+        size = os.stat(image_path).st_size
+    except FileNotFoundError:
         raise InvalidImageError(
             f"图片文件不存在: {image_path}",
             code="FILE_NOT_FOUND"
         )
-    
-    if path.stat().st_size == 0:
+
+    if size == 0:
         raise InvalidImageError(
             f"图片文件为空: {image_path}",
             code="EMPTY_FILE"
         )
-    
+
     # 检查文件大小（最大10MB）
     max_size = 10 * 1024 * 1024
-    if path.stat().st_size > max_size:
+    if size > max_size:
         raise InvalidImageError(
-            f"图片文件过大: {path.stat().st_size} 字节 (最大 {max_size} 字节)",
+            f"图片文件过大: {size} 字节 (最大 {max_size} 字节)",
             code="FILE_TOO_LARGE"
         )
-    
+
     return True
 
 
+# 结果图片编码参数：PNG 默认 zlib 6 级压缩在 2K/4K 图上耗时数百毫秒，
+# 1 级压缩快数倍，文件只大约两成
+RESULT_SAVE_OPTIONS = {
+    "PNG": {"compress_level": 1},
+    "JPEG": {"quality": 90},
+}
+
+
+def save_result_image(image: Image.Image, raw_bytes: bytes, output_path: str) -> bytes:
+    """
+    保存结果图片（先写临时文件再原子替换，进程中断时不会留下半张图片）
+
+    Gemini 返回的 PNG 未经任何变换（旋转/缩放）时直接写出原始字节，
+    省去一次 PNG 解码 + zlib 重新压缩；否则按输出路径的扩展名编码保存
+
+    Args:
+        image: 处理后的图片；PIL 只有直接从字节打开、未做变换的图片才带有 format
+        raw_bytes: Gemini 返回的原始图片字节
+        output_path: 输出图片路径
+
+    Returns:
+        bytes: 写入文件的图片数据（供调用方直接编码 Base64，无需再读回文件）
+    """
+    if image.format == "PNG" and output_path.lower().endswith(".png"):
+        data = raw_bytes
+    else:
+        output_format = Image.registered_extensions().get(Path(output_path).suffix.lower(), "PNG")
+        buf = io.BytesIO()
+        image.save(buf, format=output_format, **RESULT_SAVE_OPTIONS.get(output_format, {}))
+        data = buf.getvalue()
+
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, output_path)
+    return data
+
+
 def whiten_background(image: Image.Image) -> Image.Image:
     """
     将图片背景强制转换为纯白色
 
-    遍历所有像素，将接近白色的浅色背景强制设为纯白 RGB(255,255,255)
+    将接近白色的浅色背景强制设为纯白 RGB(255,255,255)，
     保留衣服本身的颜色不受影响。
+    按通道查表生成掩码后整体填充，逐像素判断全部在 PIL 的 C 实现中完成
 
     Args:
         image: PIL Image 对象
@@ -128,29 +169,41 @@ def whiten_background(image: Image.Image) -> Image.Image:
     if image.mode != 'RGB':
         image = image.convert('RGB')
 
-    # 获取图片数据
-    pixels = image.load()
-    width, height = image.size
-
-    # 遍历所有像素
-    for x in range(width):
-        for y in range(height):
-            r, g, b = pixels[x, y]
-            # 判断是否为背景区域（浅色像素）
-            # 条件：R、G、B 都大于阈值，且整体偏白
-            if r > 240 and g > 240 and b > 240:
-                # 检查是否可能是衣服上的白色区域（避免误伤）
-                # 如果 R、G、B 差异很小，说明是中性色，很可能是背景
-                color_diff = max(r, g, b) - min(r, g, b)
-                if color_diff < 50:  # 中性色容差
-                    pixels[x, y] = (255, 255, 255)
+    # 判断是否为背景区域（浅色像素）：R、G、B 都大于阈值。
+    # 三个通道都大于 240 时通道差最多 14，必然满足中性色容差（< 50），无需单独判断
+    r, g, b = image.split()
+    mask = ImageChops.logical_and(
+        ImageChops.logical_and(r.point(_LIGHT_PIXEL_LUT, "1"), g.point(_LIGHT_PIXEL_LUT, "1")),
+        b.point(_LIGHT_PIXEL_LUT, "1")
+    )
+    image.paste((255, 255, 255), mask=mask)
 
     return image
 
 
+# 通道值大于 240 视为浅色
+_LIGHT_PIXEL_LUT = [255 if v > 240 else 0 for v in range(256)]
+
+
+# 前端支持的宽高比，直接查表，不必每次拆分字符串
+_RATIOS = {
+    "1:1": (1, 1),
+    "2:3": (2, 3),
+    "3:2": (3, 2),
+    "3:4": (3, 4),
+    "4:3": (4, 3),
+    "4:5": (4, 5),
+    "5:4": (5, 4),
+    "9:16": (9, 16),
+    "16:9": (16, 9),
+    "21:9": (21, 9),
+}
+
+
+@lru_cache(maxsize=64)
 def calculate_target_size(aspect_ratio: str, image_size: str) -> tuple[int, int]:
     """
-    计算目标图片尺寸
+    计算目标图片尺寸（进程内缓存，宽高比 × 分辨率组合只有几十种）
     
     Args:
         aspect_ratio: 宽高比 (e.g., "16:9")
@@ -167,10 +220,15 @@ def calculate_target_size(aspect_ratio: str, image_size: str) -> tuple[int, int]
     }
     base_size = size_map.get(image_size, 1024)
 
-    try:
-        w_ratio, h_ratio = map(int, aspect_ratio.split(":"))
-    except ValueError:
-        w_ratio, h_ratio = 1, 1
+    ratio = _RATIOS.get(aspect_ratio)
+    if ratio is not None:
+        w_ratio, h_ratio = ratio
+    else:
+        # 表外的宽高比（V2 接口未做枚举校验）仍按 "W:H" 解析
+        try:
+            w_ratio, h_ratio = map(int, aspect_ratio.split(":"))
+        except ValueError:
+            w_ratio, h_ratio = 1, 1
 
     if w_ratio > h_ratio:
         # 横向：宽度为基准，高度按比例计算
@@ -184,6 +242,227 @@ def calculate_target_size(aspect_ratio: str, image_size: str) -> tuple[int, int]
     return width, height
 
 
+@lru_cache(maxsize=64)
+def build_used_prompt(prompt_mode: str = "merge", custom_prompt: Optional[str] = None) -> str:
+    """
+    按 prompt_mode 组合最终提示词（进程内缓存）
+
+    绝大多数请求不带自定义提示词，组合结果相同，缓存后直接复用同一个字符串
+
+    Args:
+        prompt_mode: builtin=仅内置, custom=仅自定义, merge=合并（默认）
+        custom_prompt: 自定义提示词
+
+    Returns:
+        str: 最终发送给 Gemini 的提示词
+    """
+    # 获取 Agent 提示词
+    builtin_prompt = get_agent_prompt()
+
+    if prompt_mode == "builtin":
+        # 仅使用内置提示词
+        return builtin_prompt
+    if prompt_mode == "custom":
+        # 仅使用自定义提示词（如果为空则使用内置）
+        return custom_prompt if custom_prompt else builtin_prompt
+    # 合并使用（默认）：内置 + 自定义
+    if custom_prompt:
+        return builtin_prompt + "\n\n" + custom_prompt
+    return builtin_prompt
+
+
+def save_gemini_result(
+    response,
+    output_path: str,
+    aspect_ratio: str = "1:1",
+    image_size: str = "1K"
+) -> str:
+    """
+    从 Gemini 响应中取出图片，调整方向和尺寸后保存
+
+    Args:
+        response: generate_content 的响应
+        output_path: 输出图片路径
+        aspect_ratio: 宽高比
+        image_size: 分辨率
+
+    Returns:
+        str: 结果图片的 Base64 编码
+
+    Raises:
+        ImageGenV2Error: 响应为空或不包含图片
+    """
+    # 检查响应
+    if not response or not response.parts:
+        raise ImageGenV2Error(
+            "Gemini API 返回空响应",
+            code="EMPTY_RESPONSE"
+        )
+
+    for part in response.parts:
+        if part.text:
+            logger.info("API返回文本: %s...", part.text[:100])
+        elif gemini_image := part.as_image():
+            # types.Image 有 image_bytes 字段，包含图片数据
+            image_bytes = gemini_image.image_bytes
+            image = Image.open(io.BytesIO(image_bytes))
+
+            # 自动修正 EXIF 方向（旋转90度等问题）；没有方向标记时保持原图对象，
+            # 以便尺寸已符合时直接写出 Gemini 返回的原始字节
+            if image.getexif().get(ExifTags.Base.Orientation, 1) != 1:
+                image = ImageOps.exif_transpose(image)
+            logger.info("Gemini返回图片尺寸（修正EXIF后）: %s", image.size)
+
+            # 确保输出目录存在
+            output_dir = Path(output_path).parent
+            output_dir.mkdir(parents=True, exist_ok=True)
+
+            # 计算目标尺寸并调整
+            target_width, target_height = calculate_target_size(aspect_ratio, image_size)
+            logger.info("目标尺寸: %dx%d", target_width, target_height)
+            logger.info("当前图片尺寸: %s", image.size)
+
+            # 记录比例用于调试；解码成功的图片宽高必然大于 0，无需防除零
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    "图片比例: %.2f, 目标比例: %.2f",
+                    image.width / image.height, target_width / target_height
+                )
+
+            # 强制旋转：如果是横图，旋转为竖图（平铺展示必须是竖向）
+            if image.width > image.height:
+                # 90° 倍数旋转用 transpose 直接搬移像素，不经过 rotate 的仿射重采样
+                image = image.transpose(Image.Transpose.ROTATE_270)
+                logger.info("旋转横图为竖图，新尺寸: %s", image.size)
+
+            if image.size != (target_width, target_height):
+                # 使用 pad 等比缩放并居中放到白底画布上，用白边填充，避免裁剪
+                logger.info("调整图片尺寸: %s -> (%d, %d) (使用等比缩放+白边填充)", image.size, target_width, target_height)
+                if image.mode != 'RGB':
+                    image = image.convert('RGB')
+                # 放大时 BICUBIC 已足够清晰且明显更快；缩小时保留 LANCZOS 抗锯齿
+                scale = min(target_width / image.width, target_height / image.height)
+                resample = Image.Resampling.BICUBIC if scale >= 1 else Image.Resampling.LANCZOS
+                image = ImageOps.pad(
+                    image,
+                    (target_width, target_height),
+                    method=resample,
+                    color='white',
+                    centering=(0.5, 0.5)
+                )
+                logger.info("已添加白边填充，图片尺寸: %s", image.size)
+            else:
+                logger.info("图片尺寸已符合目标尺寸，无需调整")
+
+            # Gemini 已直接生成纯白背景，无需额外 whiten_background 处理
+            logger.info("跳过 whiten_background，保留 Gemini 原生输出")
+
+            saved_bytes = save_result_image(image, image_bytes, output_path)
+            logger.info("图片已保存: %s", output_path)
+
+            # 直接用内存中的图片数据转换为 Base64，不再从磁盘读回
+            result_image_base64 = base64.b64encode(saved_bytes).decode('ascii')
+            logger.info("图片已转换为 Base64，长度: %d 字符", len(result_image_base64))
+            return result_image_base64
+
+    raise ImageGenV2Error(
+        "API响应中未找到图片",
+        code="NO_IMAGE_IN_RESPONSE"
+    )
+
+
+def classify_gemini_error(e: Exception) -> ImageGenV2Error:
+    """
+    将 Gemini 调用过程中的异常转换为 ImageGenV2Error 子类
+
+    Args:
+        e: 捕获到的异常
+
+    Returns:
+        ImageGenV2Error: 供调用方 raise 的错误对象
+    """
+    if isinstance(e, APIError):
+        original_error = str(e)
+        error_msg = f"Gemini API 错误: {original_error}"
+        logger.error(error_msg)
+
+        # 根据 HTTP 状态码 / gRPC 状态分类，不在错误文本里做子串匹配
+        if e.code == 429 or e.status == "RESOURCE_EXHAUSTED":
+            return RateLimitError(
+                "API 速率限制超出，请稍后重试",
+                code="RATE_LIMIT",
+                details={"original_error": original_error}
+            )
+        if e.code == 504 or e.status == "DEADLINE_EXCEEDED":
+            return TimeoutExceededError(
+                "API 请求超时",
+                code="API_TIMEOUT",
+                details={"original_error": original_error}
+            )
+        return ImageGenV2Error(
+            error_msg,
+            code="API_ERROR",
+            details={"original_error": original_error}
+        )
+
+    if isinstance(e, (TimeoutError, httpx.TimeoutException)):
+        error_msg = f"请求超时: {str(e)}"
+        logger.error(error_msg)
+        return TimeoutExceededError(
+            error_msg,
+            code="REQUEST_TIMEOUT",
+            details={"original_error": str(e)}
+        )
+
+    error_msg = f"图片处理时发生意外错误: {str(e)}"
+    logger.error(error_msg, exc_info=e)
+    return ImageGenV2Error(
+        error_msg,
+        code="UNEXPECTED_ERROR",
+        details={"error_type": type(e).__name__}
+    )
+
+
+def _prepare_gemini_call(
+    image_path: str,
+    custom_prompt: Optional[str],
+    prompt_mode: str,
+    aspect_ratio: str,
+    image_size: str
+) -> str:
+    """校验输入和 API 密钥，返回最终提示词"""
+    # 验证输入图片
+    validate_image(image_path)
+
+    # 检查API密钥
+    if not settings.GEMINI_API_KEY:
+        raise APIKeyError(
+            "GEMINI_API_KEY 未配置",
+            code="MISSING_API_KEY"
+        )
+
+    # 根据 prompt_mode 组合提示词
+    used_prompt = build_used_prompt(prompt_mode, custom_prompt)
+    logger.info("提示词模式: %s, 最终提示词长度: %d 字符", prompt_mode, len(used_prompt))
+    logger.info("生成参数: aspect_ratio=%s, image_size=%s", aspect_ratio, image_size)
+    logger.info("调用 Gemini API，模型: %s, 输入图片: %s", GEMINI_IMAGE_MODEL, image_path)
+    return used_prompt
+
+
+def _build_result(used_prompt: str, output_path: str, result_image_base64: str, start_time: float) -> Dict[str, Any]:
+    """组装处理结果"""
+    elapsed_time = time.time() - start_time
+    logger.info("图片处理完成，耗时: %.2f秒", elapsed_time)
+    return {
+        "success": True,
+        "result_path": output_path,
+        "result_image": result_image_base64,
+        "elapsed_time": round(elapsed_time, 2),
+        "used_prompt": used_prompt,
+        "error_message": None
+    }
+
+
 def process_image_with_gemini(
     image_path: str,
     output_path: str,
@@ -197,11 +476,13 @@ def process_image_with_gemini(
     使用 Gemini API 处理图片（生成白底图）
     使用单一 Agent 提示词
 
+    同步版本，调用期间阻塞当前线程；在事件循环中请使用 process_image_with_gemini_async
+
     Args:
         image_path: 输入图片路径
         output_path: 输出图片路径
         custom_prompt: 自定义提示词（追加到 Agent 提示词后）
-        timeout_seconds: 超时时间（秒）
+        timeout_seconds: API 请求超时时间（秒），作为 HTTP 超时传给 SDK，超时抛出 TimeoutExceededError
         aspect_ratio: 宽高比，支持: "1:1", "2:3", "3:2", "3:4", "4:3", "4:5", "5:4", "9:16", "16:9", "21:9"
         image_size: 分辨率，支持: "1K", "2K", "4K"
 
@@ -209,213 +490,73 @@ def process_image_with_gemini(
         Dict: 包含以下键：
             - success: 是否成功
             - result_path: 输出图片路径
+            - result_image: 结果图片 Base64
             - elapsed_time: 耗时（秒）
             - used_prompt: 使用的完整提示词
     """
     start_time = time.time()
-    result = {
-        "success": False,
-        "result_path": None,
-        "elapsed_time": 0,
-        "used_prompt": "",
-        "error_message": None
-    }
+    used_prompt = _prepare_gemini_call(image_path, custom_prompt, prompt_mode, aspect_ratio, image_size)
 
-    # 验证输入图片
-    validate_image(image_path)
+    try:
+        image_part = load_input_image(image_path)
+        logger.info("等待 API 响应 (超时: %s秒)...", timeout_seconds)
+        response = get_gemini_client().models.generate_content(
+            model=GEMINI_IMAGE_MODEL,
+            contents=[used_prompt, image_part],  # 提示词 + 图片
+            config=gemini_image_config_with_timeout(timeout_seconds),
+        )
+        logger.info("API 响应接收完成")
+        result_image_base64 = save_gemini_result(response, output_path, aspect_ratio, image_size)
+    except ImageGenV2Error:
+        raise
+    except Exception as e:
+        raise classify_gemini_error(e)
 
-    # 读取图片
-    logger.info(f"读取图片: {image_path}")
-    with open(image_path, "rb") as image_file:
-        image_data = base64.b64encode(image_file.read()).decode("utf-8")
+    return _build_result(used_prompt, output_path, result_image_base64, start_time)
 
-    # 检查API密钥
-    if not settings.GEMINI_API_KEY:
-        raise APIKeyError(
-            "GEMINI_API_KEY 未配置",
-            code="MISSING_API_KEY"
-        )
 
-    # 获取 Agent 提示词
-    builtin_prompt = get_agent_prompt()
+async def process_image_with_gemini_async(
+    image_path: str,
+    output_path: str,
+    custom_prompt: Optional[str] = None,
+    prompt_mode: str = "merge",
+    timeout_seconds: int = 600,
+    aspect_ratio: str = "1:1",
+    image_size: str = "1K"
+) -> Dict[str, Any]:
+    """
+    异步版本的 process_image_with_gemini
+
+    API 调用使用 SDK 的异步客户端（client.aio），等待 Gemini 的 30-180 秒内不占用线程；
+    读取输入和解码/保存结果这类 CPU/磁盘工作放到线程中执行。
+    timeout_seconds 对 API 调用生效，超时抛出 TimeoutExceededError
+
+    参数和返回值同 process_image_with_gemini
+    """
+    start_time = time.time()
+    used_prompt = _prepare_gemini_call(image_path, custom_prompt, prompt_mode, aspect_ratio, image_size)
 
-    # 根据 prompt_mode 组合提示词
-    if prompt_mode == "builtin":
-        # 仅使用内置提示词
-        used_prompt = builtin_prompt
-    elif prompt_mode == "custom":
-        # 仅使用自定义提示词（如果为空则使用内置）
-        used_prompt = custom_prompt if custom_prompt else builtin_prompt
-    else:
-        # 合并使用（默认）：内置 + 自定义
-        if custom_prompt:
-            used_prompt = builtin_prompt + "\n\n" + custom_prompt
-        else:
-            used_prompt = builtin_prompt
-
-    result["used_prompt"] = used_prompt
-    logger.info(f"提示词模式: {prompt_mode}, 最终提示词长度: {len(used_prompt)} 字符")
-
-    logger.info(f"使用 Agent 提示词")
-    logger.info(f"提示词长度: {len(used_prompt)} 字符")
-    logger.info(f"生成参数: aspect_ratio={aspect_ratio}, image_size={image_size}")
-    
-    # 创建 Gemini 客户端（使用 AIHubMix 代理）
-    logger.info(f"创建 Gemini 客户端，代理: https://aihubmix.com/gemini")
-    client = genai.Client(
-        api_key=settings.GEMINI_API_KEY,
-        http_options={"base_url": "https://aihubmix.com/gemini"},
-    )
-    
-    logger.info(f"调用 Gemini API，模型: gemini-3-pro-image-preview")
-    logger.info(f"输入图片: {image_path}")
-    
     try:
-        # 使用 PIL.Image 加载图片
-        logger.info(f"加载图片...")
-        input_image = Image.open(image_path)
-        logger.info(f"图片加载完成，尺寸: {input_image.size}")
-        
-        # 调用 API - 图生图模式，支持宽高比和分辨率
-        logger.info(f"发送 API 请求...")
-        config = types.GenerateContentConfig(
-            response_modalities=['TEXT', 'IMAGE'],
+        image_part = await asyncio.to_thread(load_input_image, image_path)
+        logger.info("等待 API 响应 (超时: %s秒)...", timeout_seconds)
+        response = await asyncio.wait_for(
+            get_gemini_client().aio.models.generate_content(
+                model=GEMINI_IMAGE_MODEL,
+                contents=[used_prompt, image_part],  # 提示词 + 图片
+                config=GEMINI_IMAGE_CONFIG,
+            ),
+            timeout=timeout_seconds
         )
-        
-        # 只有文本转图片才需要 image_config，图生图模式下不需要
-        # Gemini API 在图生图时会保持原图比例
-        logger.info(f"等待 API 响应 (超时: {timeout_seconds}秒)...")
-        response = client.models.generate_content(
-            model="gemini-3-pro-image-preview",
-            contents=[used_prompt, input_image],  # 提示词 + 图片
-            config=config,
+        logger.info("API 响应接收完成")
+        result_image_base64 = await asyncio.to_thread(
+            save_gemini_result, response, output_path, aspect_ratio, image_size
         )
-        logger.info(f"API 响应接收完成")
-        
-        # 检查响应
-        if not response or not response.parts:
-            raise ImageGenV2Error(
-                "Gemini API 返回空响应",
-                code="EMPTY_RESPONSE"
-            )
-        
-        # 保存生成的图片
-        result_path = None
-        result_image_base64 = None
-        for part in response.parts:
-            if part.text:
-                logger.info(f"API返回文本: {part.text[:100]}...")
-            elif gemini_image := part.as_image():
-                # types.Image 有 image_bytes 字段，包含图片数据
-                image_bytes = gemini_image.image_bytes
-                image = Image.open(io.BytesIO(image_bytes))
-
-                # 自动修正 EXIF 方向（旋转90度等问题）
-                image = ImageOps.exif_transpose(image)
-                logger.info(f"Gemini返回图片尺寸（修正EXIF后）: {image.size}")
-
-                # 确保输出目录存在
-                output_dir = Path(output_path).parent
-                output_dir.mkdir(parents=True, exist_ok=True)
-
-                # 计算目标尺寸并调整
-                target_width, target_height = calculate_target_size(aspect_ratio, image_size)
-                logger.info(f"目标尺寸: {target_width}x{target_height}")
-                logger.info(f"当前图片尺寸: {image.size}")
-
-                # 记录比例用于调试
-                image_ratio = image.width / image.height if image.height > 0 else 1
-                target_ratio = target_width / target_height if target_height > 0 else 1
-                logger.info(f"图片比例: {image_ratio:.2f}, 目标比例: {target_ratio:.2f}")
-
-                # 强制旋转：如果是横图，旋转为竖图（平铺展示必须是竖向）
-                if image.width > image.height:
-                    image = image.rotate(-90, expand=True)
-                    logger.info(f"旋转横图为竖图，新尺寸: {image.size}")
-
-                if image.size != (target_width, target_height):
-                    # 使用 contain 保持比例，用白边填充，避免裁剪
-                    logger.info(f"调整图片尺寸: {image.size} -> ({target_width}, {target_height}) (使用等比缩放+白边填充)")
-                    scaled_image = ImageOps.contain(image, (target_width, target_height), Image.Resampling.LANCZOS)
-                    # 创建白底画布并粘贴缩放后的图片（居中）
-                    image = Image.new('RGB', (target_width, target_height), 'white')
-                    paste_x = (target_width - scaled_image.width) // 2
-                    paste_y = (target_height - scaled_image.height) // 2
-                    image.paste(scaled_image, (paste_x, paste_y))
-                    logger.info(f"已添加白边填充，图片尺寸: {image.size}")
-                else:
-                    logger.info(f"图片尺寸已符合目标尺寸，无需调整")
-
-                # Gemini 已直接生成纯白背景，无需额外 whiten_background 处理
-                logger.info(f"跳过 whiten_background，保留 Gemini 原生输出")
-
-                image.save(output_path)
-                result_path = output_path
-                logger.info(f"图片已保存: {output_path}")
-                
-                # 读取图片并转换为 Base64
-                with open(output_path, "rb") as img_file:
-                    result_image_base64 = base64.b64encode(img_file.read()).decode('utf-8')
-                logger.info(f"图片已转换为 Base64，长度: {len(result_image_base64)} 字符")
-                break
-        
-        if not result_path:
-            raise ImageGenV2Error(
-                "API响应中未找到图片",
-                code="NO_IMAGE_IN_RESPONSE"
-            )
-        
-        elapsed_time = time.time() - start_time
-        logger.info(f"图片处理完成，耗时: {elapsed_time:.2f}秒")
-        
-        result["success"] = True
-        result["result_path"] = result_path
-        result["result_image"] = result_image_base64
-        result["elapsed_time"] = round(elapsed_time, 2)
-        
-        return result
-        
-    except APIError as e:
-        error_msg = f"Gemini API 错误: {str(e)}"
-        logger.error(error_msg)
-        
-        # 根据错误类型分类
-        if "RESOURCE_EXHAUSTED" in str(e) or "429" in str(e):
-            raise RateLimitError(
-                "API 速率限制超出，请稍后重试",
-                code="RATE_LIMIT",
-                details={"original_error": str(e)}
-            )
-        elif "DEADLINE_EXCEEDED" in str(e) or "504" in str(e):
-            raise TimeoutExceededError(
-                "API 请求超时",
-                code="API_TIMEOUT",
-                details={"original_error": str(e)}
-            )
-        else:
-            raise ImageGenV2Error(
-                error_msg,
-                code="API_ERROR",
-                details={"original_error": str(e)}
-            )
-        
-    except TimeoutError as e:
-        error_msg = f"请求超时: {str(e)}"
-        logger.error(error_msg)
-        raise TimeoutExceededError(
-            error_msg,
-            code="REQUEST_TIMEOUT",
-            details={"original_error": str(e)}
-        )
-        
+    except ImageGenV2Error:
+        raise
     except Exception as e:
-        error_msg = f"图片处理时发生意外错误: {str(e)}"
-        logger.error(error_msg, exc_info=True)
-        raise ImageGenV2Error(
-            error_msg,
-            code="UNEXPECTED_ERROR",
-            details={"error_type": type(e).__name__}
-        )
+        raise classify_gemini_error(e)
+
+    return _build_result(used_prompt, output_path, result_image_base64, start_time)
 
 
 def preview_prompt() -> str:
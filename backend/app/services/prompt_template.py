@@ -2,6 +2,7 @@
 电商白底图生成 Agent 提示词
 使用单一的 Agent 风格提示词，而非模板链条
 """
+import re
 from dataclasses import dataclass
 from typing import Dict, Any
 
@@ -74,7 +75,11 @@ def get_agent_prompt() -> str:
     return AGENT_PROMPT
 
 
-@dataclass
+# 模板占位符，形如 {name}
+_PLACEHOLDER_RE = re.compile(r"\{(\w+)\}")
+
+
+@dataclass(slots=True)
 class PromptTemplate:
     """提示词模板类（保留用于可能的扩展）"""
 
@@ -99,11 +104,14 @@ class PromptTemplate:
         Returns:
             str: 渲染后的提示词
         """
-        result = self.prompt_template
-        for key, value in kwargs.items():
-            placeholder = "{" + key + "}"
-            result = result.replace(placeholder, str(value))
-        return result
+        # 无变量时直接返回原字符串
+        if not kwargs:
+            return self.prompt_template
+        # 单次扫描替换全部占位符，未提供的占位符原样保留
+        return _PLACEHOLDER_RE.sub(
+            lambda m: str(kwargs[m.group(1)]) if m.group(1) in kwargs else m.group(0),
+            self.prompt_template
+        )
 
 
 # 全局提示词实例（单例模式）
@@ -113,6 +113,9 @@ class TaskQueue:
 
         self._tasks: Dict[str, TaskInfo] = {}
         self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="task_worker")
+        # 实际任务函数（阻塞的 Gemini 调用）使用独立线程池执行：
+        # 若与 _run_task 共用 _executor，每个任务占两个线程，4 个任务同时等待时内层调用永远排不上队
+        self._call_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="task_call")
         self._cleanup_task = None
         self._lock = threading.RLock()
         self._initialized = True
@@ -191,7 +194,7 @@ class TaskQueue:
             try:
                 # 使用 asyncio.wait_for 实现超时控制
                 future = loop.run_in_executor(
-                    self._executor,
+                    self._call_executor,
                     lambda: task_func(*args, **kwargs)
                 )
 
@@ -295,6 +298,16 @@ class TaskQueue:
         thread = threading.Thread(target=lambda: asyncio.run(periodic_cleanup()), daemon=True)
         thread.start()
 
+    def shutdown(self) -> None:
+        """
+        关闭任务线程池（应用退出时调用）
+
+        不等待进行中的 Gemini 调用结束，未开始的任务直接取消，避免关闭时长时间阻塞
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._call_executor.shutdown(wait=False, cancel_futures=True)
+        logger.info("Task queue executors shut down")
+
     def get_queue_stats(self) -> dict:
         """获取队列统计信息"""
         with self._lock:
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+数据库迁移脚本：为 generation_tasks 表添加任务历史查询索引
+
+- ix_generation_tasks_user_created: (user_id, created_at)
+- ix_generation_tasks_user_status_created: (user_id, status, created_at)
+
+使用方法:
+    python migrate_add_task_indexes.py
+
+注意事项:
+    - 数据库连接读取应用配置 get_settings().DATABASE_URL（.env 中的 DB_*）
+    - 运行前建议备份数据库
+"""
+
+import sys
+import os
+
+# 添加后端路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine, text
+from app.config import get_settings
+
+INDEXES = {
+    "ix_generation_tasks_user_created": "(user_id, created_at)",
+    "ix_generation_tasks_user_status_created": "(user_id, status, created_at)",
+}
+
+
+def run_migration():
+    """执行迁移"""
+    print("=" * 60)
+    print("数据库迁移: 添加任务历史查询索引")
+    print("=" * 60)
+
+    # 与应用使用同一份数据库配置（.env / 环境变量中的 DB_*）
+    database_url = get_settings().DATABASE_URL
+    if not database_url:
+        print("✗ 未配置数据库连接，请在 .env 中设置 DB_HOST / DB_USER / DB_PASSWORD / DB_NAME")
+        return False
+    print(f"数据库连接: {database_url.split('://')[0]}://...@{database_url.rsplit('@', 1)[-1]} (账号密码已隐藏)")
+    print()
+
+    # 创建数据库引擎
+    engine = create_engine(database_url, echo=False)
+
+    try:
+        with engine.connect() as conn:
+            print("✓ 数据库连接成功")
+
+            for name, columns in INDEXES.items():
+                # 检查索引是否已存在
+                result = conn.execute(
+                    text("SHOW INDEX FROM generation_tasks WHERE Key_name = :name"),
+                    {"name": name}
+                )
+                if result.fetchone() is not None:
+                    print(f"⚠ 索引 {name} 已存在，跳过")
+                    continue
+
+                print(f"正在创建索引 {name} {columns}...")
+                conn.execute(text(f"CREATE INDEX {name} ON generation_tasks {columns}"))
+                conn.commit()
+                print(f"✓ 索引 {name} 创建成功")
+
+        print()
+        print("=" * 60)
+        print("迁移完成!")
+        print("=" * 60)
+        return True
+
+    except Exception as e:
+        print(f"✗ 迁移失败: {e}")
+        print()
+        print("请检查 .env 中的数据库配置或手动执行 SQL:")
+        for name, columns in INDEXES.items():
+            print(f"  CREATE INDEX {name} ON generation_tasks {columns};")
+        return False
+
+
+if __name__ == "__main__":
+    success = run_migration()
+    sys.exit(0 if success else 1)
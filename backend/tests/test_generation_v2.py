@@ -0,0 +1,427 @@
+"""
+V2 图片生成路由测试
+测试响应模型构建、上传辅助函数，以及基于 SQLite 测试库的接口行为
+"""
+import asyncio
+import io
+from datetime import datetime
+
+import pytest
+from fastapi import UploadFile
+from httpx import ASGITransport, AsyncClient
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.auth import create_access_token
+from app.database import get_db
+from app.errors import AppException
+from app.main import app
+from app.models import Base, GenerationTask, TaskStatus, User
+from app.routes import generation_v2
+from app.routes.generation_v2 import (
+    V2TaskHistoryItem,
+    make_image_url,
+    split_file_ext,
+    get_task_event,
+    set_task_event,
+    save_upload_file,
+    UPLOAD_CHUNK_SIZE,
+)
+
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    """文件 SQLite 测试库：请求 Session 与后台/SSE 使用的 SessionLocal 是独立连接"""
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'test.db'}",
+        connect_args={"check_same_thread": False}
+    )
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    monkeypatch.setattr(generation_v2, "SessionLocal", factory)
+    app.dependency_overrides[get_db] = override_get_db
+    yield factory
+    app.dependency_overrides.pop(get_db, None)
+    engine.dispose()
+
+
+def create_user(factory, email: str, credits: int = 10) -> int:
+    with factory() as db:
+        user = User(email=email, hashed_password="x", username=email.split("@")[0], credits=credits)
+        db.add(user)
+        db.commit()
+        return user.id
+
+
+def create_task(factory, user_id: int, status: TaskStatus, result_image_url=None) -> int:
+    with factory() as db:
+        task = GenerationTask(
+            user_id=user_id,
+            original_image_url="uploads/original.png",
+            result_image_url=result_image_url,
+            status=status,
+        )
+        db.add(task)
+        db.commit()
+        return task.id
+
+
+def update_task_status(factory, task_id: int, status: TaskStatus) -> None:
+    with factory() as db:
+        db.get(GenerationTask, task_id).status = status
+        db.commit()
+
+
+def auth_headers(user_id: int) -> dict:
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': str(user_id)})}"}
+
+
+def api_client() -> AsyncClient:
+    return AsyncClient(transport=ASGITransport(app=app), base_url="http://test")
+
+
+class TestV2TaskHistoryItem:
+    """V2TaskHistoryItem 模型测试"""
+
+    def test_from_task(self):
+        """测试直接由 ORM 对象构建任务历史项"""
+        task = GenerationTask(
+            id=1,
+            user_id=2,
+            original_image_url="uploads/1_original.png",
+            result_image_url="results/1_result.png",
+            status=TaskStatus.COMPLETED,
+            credits_used=1,
+            width=1024,
+            height=1024,
+            created_at=datetime(2026, 1, 8, 10, 30),
+            elapsed_time=12.5,
+        )
+
+        item = V2TaskHistoryItem.from_task(task)
+
+        assert item.id == 1
+        assert item.status == "completed"
+        assert item.original_image_url == make_image_url("uploads/1_original.png")
+        assert item.result_image_url == make_image_url("results/1_result.png")
+        assert item.created_at == "2026-01-08T10:30:00"
+        assert item.elapsed_time == 12.5
+
+    def test_from_task_empty_fields(self):
+        """测试空路径和空创建时间"""
+        task = GenerationTask(
+            id=3,
+            user_id=2,
+            original_image_url="uploads/3_original.png",
+            result_image_url=None,
+            status=TaskStatus.PENDING,
+            credits_used=1,
+            width=1024,
+            height=1024,
+            created_at=None,
+        )
+
+        item = V2TaskHistoryItem.from_task(task)
+
+        assert item.result_image_url == ""
+        assert item.created_at == ""
+
+
+class TestSplitFileExt:
+    """上传文件扩展名提取测试"""
+
+    def test_normal_ext(self):
+        assert split_file_ext("shirt.PNG") == (".PNG", "png")
+        assert split_file_ext("a.b.webp") == (".webp", "webp")
+
+    def test_missing_ext_defaults_to_jpg(self):
+        assert split_file_ext(None) == (".jpg", "")
+        assert split_file_ext("") == (".jpg", "")
+        assert split_file_ext("noext") == (".jpg", "")
+        assert split_file_ext("trailing.") == (".jpg", "")
+
+    def test_rejects_path_characters(self):
+        assert split_file_ext("x.jpg/../../etc") == (".jpg", "")
+        assert split_file_ext("evil.p\\ng") == (".jpg", "")
+
+
+class TestTaskEvents:
+    """SSE 任务完成事件测试"""
+
+    @pytest.mark.asyncio
+    async def test_set_task_event_wakes_waiters(self):
+        """测试任务结束时唤醒等待方并清理事件"""
+        event = get_task_event(1001)
+        assert get_task_event(1001) is event
+
+        waiter = asyncio.create_task(event.wait())
+        await asyncio.sleep(0)
+        set_task_event(1001)
+
+        await asyncio.wait_for(waiter, timeout=1)
+        assert event.is_set()
+        assert get_task_event(1001) is not event
+
+    def test_set_task_event_without_waiters(self):
+        """测试没有订阅方时触发事件不报错"""
+        set_task_event(1002)
+
+
+class TestStreamTaskEvents:
+    """SSE 任务结果订阅接口测试"""
+
+    async def _wait_registered(self, task_id: int):
+        while task_id not in generation_v2._task_events:
+            await asyncio.sleep(0.01)
+
+    @pytest.mark.asyncio
+    async def test_completed_event(self, session_factory):
+        """测试任务完成事件触发后推送最终状态并关闭"""
+        user_id = create_user(session_factory, "sse1@example.com")
+        task_id = create_task(session_factory, user_id, TaskStatus.PROCESSING)
+
+        async with api_client() as client:
+            request = asyncio.create_task(
+                client.get(f"/api/v2/tasks/{task_id}/events", headers=auth_headers(user_id))
+            )
+            await asyncio.wait_for(self._wait_registered(task_id), timeout=2)
+            update_task_status(session_factory, task_id, TaskStatus.COMPLETED)
+            set_task_event(task_id)
+            response = await asyncio.wait_for(request, timeout=2)
+
+        assert response.status_code == 200
+        assert response.text.startswith("event: completed\n")
+        assert f'"task_id":{task_id}' in response.text
+
+    @pytest.mark.asyncio
+    async def test_already_finished_task(self, session_factory):
+        """测试订阅时任务已结束，立即推送最终状态"""
+        user_id = create_user(session_factory, "sse2@example.com")
+        task_id = create_task(session_factory, user_id, TaskStatus.FAILED)
+
+        async with api_client() as client:
+            response = await asyncio.wait_for(
+                client.get(f"/api/v2/tasks/{task_id}/events", headers=auth_headers(user_id)),
+                timeout=2
+            )
+
+        assert response.text.startswith("event: failed\n")
+        assert task_id not in generation_v2._task_events
+
+    @pytest.mark.asyncio
+    async def test_completion_between_query_and_register(self, session_factory, monkeypatch):
+        """测试首次查询之后、注册事件之前完成的任务不会被漏掉"""
+        user_id = create_user(session_factory, "sse3@example.com")
+        task_id = create_task(session_factory, user_id, TaskStatus.PROCESSING)
+        real_get_task_event = generation_v2.get_task_event
+
+        def complete_then_register(tid):
+            update_task_status(session_factory, tid, TaskStatus.COMPLETED)
+            return real_get_task_event(tid)
+
+        monkeypatch.setattr(generation_v2, "get_task_event", complete_then_register)
+
+        async with api_client() as client:
+            response = await asyncio.wait_for(
+                client.get(f"/api/v2/tasks/{task_id}/events", headers=auth_headers(user_id)),
+                timeout=2
+            )
+
+        assert response.text.startswith("event: completed\n")
+
+    @pytest.mark.asyncio
+    async def test_heartbeat_falls_back_to_database(self, session_factory, monkeypatch):
+        """测试未收到事件时，心跳查库发现任务结束后关闭连接"""
+        monkeypatch.setattr(generation_v2, "SSE_HEARTBEAT_SECONDS", 0.02)
+        user_id = create_user(session_factory, "sse4@example.com")
+        task_id = create_task(session_factory, user_id, TaskStatus.PROCESSING)
+
+        async with api_client() as client:
+            request = asyncio.create_task(
+                client.get(f"/api/v2/tasks/{task_id}/events", headers=auth_headers(user_id))
+            )
+            await asyncio.sleep(0.1)
+            update_task_status(session_factory, task_id, TaskStatus.FAILED)
+            response = await asyncio.wait_for(request, timeout=2)
+
+        assert response.text.startswith(": heartbeat\n\n")
+        assert "event: failed\n" in response.text
+        assert task_id not in generation_v2._task_events
+
+    @pytest.mark.asyncio
+    async def test_max_lifetime_timeout(self, session_factory, monkeypatch):
+        """测试超过最长保持时间后推送 timeout 事件并清理登记"""
+        monkeypatch.setattr(generation_v2, "SSE_HEARTBEAT_SECONDS", 0.01)
+        monkeypatch.setattr(generation_v2, "SSE_MAX_LIFETIME_SECONDS", 0.05)
+        user_id = create_user(session_factory, "sse5@example.com")
+        task_id = create_task(session_factory, user_id, TaskStatus.PENDING)
+
+        async with api_client() as client:
+            response = await asyncio.wait_for(
+                client.get(f"/api/v2/tasks/{task_id}/events", headers=auth_headers(user_id)),
+                timeout=2
+            )
+
+        assert response.text.endswith("event: timeout\ndata: {}\n\n")
+        assert task_id not in generation_v2._task_events
+
+    @pytest.mark.asyncio
+    async def test_other_users_task_not_found(self, session_factory):
+        """测试不能订阅其他用户的任务"""
+        owner_id = create_user(session_factory, "owner@example.com")
+        other_id = create_user(session_factory, "other@example.com")
+        task_id = create_task(session_factory, owner_id, TaskStatus.PROCESSING)
+
+        async with api_client() as client:
+            response = await client.get(f"/api/v2/tasks/{task_id}/events", headers=auth_headers(other_id))
+
+        assert response.status_code == 404
+        assert response.json()["error_code"] == "TASK_NOT_FOUND"
+        assert task_id not in generation_v2._task_events
+
+
+class TestDownloadTaskResult:
+    """任务结果下载接口测试"""
+
+    @pytest.mark.asyncio
+    async def test_download_own_result(self, session_factory, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "results").mkdir()
+        (tmp_path / "results" / "1_result.png").write_bytes(b"png-bytes")
+        user_id = create_user(session_factory, "dl1@example.com")
+        task_id = create_task(session_factory, user_id, TaskStatus.COMPLETED, "results/1_result.png")
+
+        async with api_client() as client:
+            response = await client.get(f"/api/v2/tasks/{task_id}/download", headers=auth_headers(user_id))
+
+        assert response.status_code == 200
+        assert response.content == b"png-bytes"
+        assert response.headers["content-type"] == "image/png"
+        assert "1_result.png" in response.headers["content-disposition"]
+
+    @pytest.mark.asyncio
+    async def test_other_users_task_not_found(self, session_factory, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "results").mkdir()
+        (tmp_path / "results" / "2_result.png").write_bytes(b"png-bytes")
+        owner_id = create_user(session_factory, "dl-owner@example.com")
+        other_id = create_user(session_factory, "dl-other@example.com")
+        task_id = create_task(session_factory, owner_id, TaskStatus.COMPLETED, "results/2_result.png")
+
+        async with api_client() as client:
+            response = await client.get(f"/api/v2/tasks/{task_id}/download", headers=auth_headers(other_id))
+
+        assert response.status_code == 404
+        assert response.json()["error_code"] == "TASK_NOT_FOUND"
+
+    @pytest.mark.asyncio
+    async def test_missing_result_file(self, session_factory, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        user_id = create_user(session_factory, "dl2@example.com")
+        task_id = create_task(session_factory, user_id, TaskStatus.COMPLETED, "results/3_result.png")
+
+        async with api_client() as client:
+            response = await client.get(f"/api/v2/tasks/{task_id}/download", headers=auth_headers(user_id))
+
+        assert response.status_code == 404
+        assert response.json()["error_code"] == "TASK_NOT_FOUND"
+
+    @pytest.mark.asyncio
+    async def test_unfinished_task(self, session_factory):
+        user_id = create_user(session_factory, "dl3@example.com")
+        task_id = create_task(session_factory, user_id, TaskStatus.PROCESSING)
+
+        async with api_client() as client:
+            response = await client.get(f"/api/v2/tasks/{task_id}/download", headers=auth_headers(user_id))
+
+        assert response.status_code == 400
+        assert response.json()["error_code"] == "VALIDATION_ERROR"
+        assert response.json()["details"]["status"] == "processing"
+
+
+def png_upload(size=(8, 8)) -> dict:
+    buf = io.BytesIO()
+    Image.new("RGB", size, "white").save(buf, format="PNG")
+    return {"file": ("shirt.png", buf.getvalue(), "image/png")}
+
+
+class TestCreateAsyncTask:
+    """异步任务提交接口测试"""
+
+    @pytest.mark.asyncio
+    async def test_returns_202_and_pending_task(self, session_factory, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "uploads").mkdir()
+        started = []
+
+        async def fake_background(**kwargs):
+            started.append(kwargs["task_id"])
+
+        monkeypatch.setattr(generation_v2, "process_task_background", fake_background)
+        user_id = create_user(session_factory, "async1@example.com", credits=5)
+
+        async with api_client() as client:
+            response = await client.post("/api/v2/tasks/async", files=png_upload(), headers=auth_headers(user_id))
+            await asyncio.sleep(0)
+
+        assert response.status_code == 202
+        body = response.json()
+        assert body["status"] == "pending"
+        assert started == [body["task_id"]]
+        with session_factory() as db:
+            task = db.get(GenerationTask, body["task_id"])
+            assert task.status == TaskStatus.PENDING
+            assert (tmp_path / task.original_image_url).is_file()
+            assert db.get(User, user_id).credits == 4
+
+    @pytest.mark.asyncio
+    async def test_oversize_upload_rejected_before_task_created(self, session_factory, monkeypatch):
+        monkeypatch.setattr(generation_v2, "MAX_UPLOAD_SIZE", 100)
+        user_id = create_user(session_factory, "async2@example.com", credits=5)
+
+        async with api_client() as client:
+            response = await client.post(
+                "/api/v2/tasks/async",
+                files={"file": ("big.png", b"x" * 200, "image/png")},
+                headers=auth_headers(user_id)
+            )
+
+        assert response.status_code == 400
+        assert response.json()["error_code"] == "IMAGE_TOO_LARGE"
+        with session_factory() as db:
+            assert db.query(GenerationTask).count() == 0
+            assert db.get(User, user_id).credits == 5
+
+
+class TestSaveUploadFile:
+    """上传文件分块写入测试"""
+
+    @pytest.mark.asyncio
+    async def test_writes_file_in_chunks(self, tmp_path):
+        data = b"x" * (UPLOAD_CHUNK_SIZE * 2 + 10)
+        path = tmp_path / "upload.png"
+
+        size = await save_upload_file(UploadFile(io.BytesIO(data)), str(path))
+
+        assert size == len(data)
+        assert path.read_bytes() == data
+
+    @pytest.mark.asyncio
+    async def test_too_large_removes_partial_file(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(generation_v2, "MAX_UPLOAD_SIZE", 100)
+        path = tmp_path / "upload.png"
+
+        with pytest.raises(AppException):
+            await generation_v2.save_upload_file(UploadFile(io.BytesIO(b"x" * 200)), str(path))
+
+        assert not path.exists()
+
@@ -0,0 +1,123 @@
+"""
+V1 图片生成服务测试
+测试 Gemini 错误分类和重试退避逻辑
+"""
+from types import SimpleNamespace
+
+import pytest
+from google.genai.errors import APIError
+from PIL import Image
+
+from app.services import image_gen
+from app.services.image_gen import (
+    RETRY_BACKOFF_SECONDS,
+    ImageGenerationError,
+    RateLimitError,
+    TimeoutExceededError,
+    generate_white_bg_with_retry,
+    remove_background_with_gemini,
+)
+
+
+@pytest.fixture
+def input_image(tmp_path):
+    path = tmp_path / "input.png"
+    Image.new("RGB", (8, 8), "white").save(path)
+    return str(path)
+
+
+def fail_with(monkeypatch, error: Exception):
+    """让 Gemini 客户端的 generate_content 抛出指定异常"""
+    def generate_content(**kwargs):
+        raise error
+
+    client = SimpleNamespace(models=SimpleNamespace(generate_content=generate_content))
+    monkeypatch.setattr(image_gen, "get_gemini_client", lambda: client)
+    monkeypatch.setattr(image_gen.settings, "GEMINI_API_KEY", "test-key")
+
+
+class TestAPIErrorClassification:
+    """APIError 按状态码 / gRPC 状态分类测试"""
+
+    @pytest.mark.parametrize("error", [
+        APIError(429, {"error": {"message": "Too many requests"}}),
+        APIError(400, {"error": {"status": "RESOURCE_EXHAUSTED", "message": "quota"}}),
+    ])
+    def test_rate_limit(self, monkeypatch, input_image, tmp_path, error):
+        fail_with(monkeypatch, error)
+
+        with pytest.raises(RateLimitError) as exc_info:
+            remove_background_with_gemini(input_image, str(tmp_path / "out.png"))
+
+        assert exc_info.value.code == "RATE_LIMIT"
+
+    def test_deadline_exceeded(self, monkeypatch, input_image, tmp_path):
+        fail_with(monkeypatch, APIError(504, {"error": {"status": "DEADLINE_EXCEEDED"}}))
+
+        with pytest.raises(TimeoutExceededError) as exc_info:
+            remove_background_with_gemini(input_image, str(tmp_path / "out.png"))
+
+        assert exc_info.value.code == "API_TIMEOUT"
+
+    def test_message_text_not_matched(self, monkeypatch, input_image, tmp_path):
+        """错误文本中出现 429 / quota 字样不影响分类"""
+        fail_with(monkeypatch, APIError(400, {"error": {"message": "429 quota in prompt"}}))
+
+        with pytest.raises(ImageGenerationError) as exc_info:
+            remove_background_with_gemini(input_image, str(tmp_path / "out.png"))
+
+        assert exc_info.value.code == "API_ERROR"
+
+
+class TestRetryBackoff:
+    """重试退避测试"""
+
+    @pytest.fixture
+    def sleeps(self, monkeypatch):
+        calls = []
+        monkeypatch.setattr(image_gen.time, "sleep", calls.append)
+        return calls
+
+    def test_no_sleep_after_last_attempt(self, monkeypatch, sleeps):
+        attempts = []
+
+        def always_rate_limited(**kwargs):
+            attempts.append(1)
+            raise RateLimitError("limited", code="RATE_LIMIT")
+
+        monkeypatch.setattr(image_gen, "remove_background_with_gemini", always_rate_limited)
+
+        with pytest.raises(ImageGenerationError) as exc_info:
+            generate_white_bg_with_retry("in.png", "out.png", max_retries=3)
+
+        assert exc_info.value.code == "MAX_RETRIES_EXCEEDED"
+        assert len(attempts) == 4
+        assert len(sleeps) == len(attempts) - 1
+        for wait, base in zip(sleeps, RETRY_BACKOFF_SECONDS):
+            assert base <= wait < base + 1
+
+    def test_backoff_capped_at_last_step(self, monkeypatch, sleeps):
+        def always_timed_out(**kwargs):
+            raise TimeoutExceededError("timeout", code="API_TIMEOUT")
+
+        monkeypatch.setattr(image_gen, "remove_background_with_gemini", always_timed_out)
+
+        with pytest.raises(ImageGenerationError):
+            generate_white_bg_with_retry("in.png", "out.png", max_retries=len(RETRY_BACKOFF_SECONDS) + 1)
+
+        assert len(sleeps) == len(RETRY_BACKOFF_SECONDS) + 1
+        assert RETRY_BACKOFF_SECONDS[-1] <= sleeps[-1] < RETRY_BACKOFF_SECONDS[-1] + 1
+
+    def test_success_after_retry(self, monkeypatch, sleeps):
+        results = iter([RateLimitError("limited", code="RATE_LIMIT"), "out.png"])
+
+        def flaky(**kwargs):
+            result = next(results)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        monkeypatch.setattr(image_gen, "remove_background_with_gemini", flaky)
+
+        assert generate_white_bg_with_retry("in.png", "out.png") == "out.png"
+        assert len(sleeps) == 1
@@ -0,0 +1,81 @@
+"""
+V2 图片生成服务测试
+测试提示词组合、尺寸计算和结果图片处理等不调用 Gemini 的辅助逻辑
+"""
+import io
+
+from PIL import Image
+
+from app.services.image_gen_v2 import (
+    build_used_prompt,
+    calculate_target_size,
+    save_result_image,
+    whiten_background,
+)
+from app.services.prompt_template import AGENT_PROMPT
+
+
+def png_bytes(size=(10, 20)) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", size, "white").save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class TestBuildUsedPrompt:
+    """提示词组合测试"""
+
+    def test_modes(self):
+        assert build_used_prompt("merge", None) == AGENT_PROMPT
+        assert build_used_prompt("merge", "加阴影") == AGENT_PROMPT + "\n\n加阴影"
+        assert build_used_prompt("builtin", "加阴影") == AGENT_PROMPT
+        assert build_used_prompt("custom", "加阴影") == "加阴影"
+        assert build_used_prompt("custom", None) == AGENT_PROMPT
+
+
+class TestCalculateTargetSize:
+    """目标尺寸计算测试"""
+
+    def test_known_and_fallback_ratios(self):
+        assert calculate_target_size("16:9", "2K") == (2048, 1152)
+        assert calculate_target_size("3:4", "1K") == (768, 1024)
+        assert calculate_target_size("7:3", "1K") == (1024, 438)
+        assert calculate_target_size("bad", "1K") == (1024, 1024)
+        assert calculate_target_size("1:2:3", "4K") == (4096, 4096)
+
+
+class TestSaveResultImage:
+    """结果图片保存测试"""
+
+    def test_untransformed_png_written_as_is(self, tmp_path):
+        raw = png_bytes()
+        path = tmp_path / "1_result.png"
+
+        save_result_image(Image.open(io.BytesIO(raw)), raw, str(path))
+
+        assert path.read_bytes() == raw
+        assert not (tmp_path / "1_result.png.tmp").exists()
+
+    def test_transformed_image_is_encoded(self, tmp_path):
+        raw = png_bytes()
+        image = Image.open(io.BytesIO(raw)).rotate(-90, expand=True)
+        path = tmp_path / "2_result.png"
+
+        save_result_image(image, raw, str(path))
+
+        assert Image.open(path).size == (20, 10)
+
+
+class TestWhitenBackground:
+    """背景强制白化测试"""
+
+    def test_only_light_pixels_become_white(self):
+        image = Image.new("RGB", (3, 1))
+        image.putpixel((0, 0), (245, 250, 241))  # 浅色背景
+        image.putpixel((1, 0), (240, 250, 250))  # 有一个通道未超过阈值
+        image.putpixel((2, 0), (200, 30, 30))    # 衣服颜色
+
+        result = whiten_background(image)
+
+        assert result.getpixel((0, 0)) == (255, 255, 255)
+        assert result.getpixel((1, 0)) == (240, 250, 250)
+        assert result.getpixel((2, 0)) == (200, 30, 30)
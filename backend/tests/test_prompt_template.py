@@ -0,0 +1,25 @@
+"""
+提示词模板测试
+"""
+from app.services.prompt_template import PromptTemplate
+
+
+class TestPromptTemplateRender:
+    """提示词模板渲染测试"""
+
+    def test_render(self):
+        template = PromptTemplate("t", "t", "", "背景 {color}，保留 {missing}，尺寸 {size}")
+
+        assert template.render(color="白色", size=1024) == "背景 白色，保留 {missing}，尺寸 1024"
+        assert template.render() == template.prompt_template
+
+    def test_render_without_placeholders(self):
+        template = PromptTemplate("t", "t", "", "纯白背景")
+
+        assert template.render(color="白色") is template.prompt_template
+
+    def test_render_after_template_changed(self):
+        template = PromptTemplate("t", "t", "", "纯白背景")
+        template.prompt_template = "背景 {color}"
+
+        assert template.render(color="白色") == "背景 白色"
@@ -0,0 +1,62 @@
+"""
+Schema 测试
+测试 V1 任务响应的序列化结果
+"""
+import json
+from datetime import datetime
+
+from app.models import GenerationTask, TaskStatus
+from app.schemas import TaskHistoryResponse, TaskStatusResponse, build_full_url
+
+
+def make_task(**overrides) -> GenerationTask:
+    fields = dict(
+        id=7,
+        user_id=1,
+        original_image_url="uploads/7_original.png",
+        result_image_url="results/7_result.png",
+        status=TaskStatus.COMPLETED,
+        progress=None,
+        credits_used=1,
+        width=1024,
+        height=1024,
+        created_at=datetime(2026, 1, 8, 10, 30),
+    )
+    fields.update(overrides)
+    return GenerationTask(**fields)
+
+
+class TestTaskStatusResponse:
+    """TaskStatusResponse 序列化测试"""
+
+    def test_from_task_serializes_urls_not_paths(self):
+        data = json.loads(TaskStatusResponse.from_task(make_task()).model_dump_json())
+
+        assert data["original_image_url"] == build_full_url("uploads/7_original.png")
+        assert data["result_image_url"] == build_full_url("results/7_result.png")
+        assert data["original_image_url"].startswith(("http://", "https://"))
+        assert "original_image_path" not in data
+        assert "result_image_path" not in data
+        assert data["status"] == "completed"
+        assert data["progress"] == 0
+
+    def test_from_task_matches_validated_model(self):
+        task = make_task(result_image_url=None, status=TaskStatus.PROCESSING, progress=40)
+
+        constructed = TaskStatusResponse.from_task(task).model_dump()
+        validated = TaskStatusResponse.model_validate(task).model_dump()
+
+        assert constructed == validated
+        assert constructed["result_image_url"] is None
+
+    def test_history_response_json(self):
+        """V1 /api/tasks 直接序列化 model_construct 构建的响应"""
+        response = TaskHistoryResponse.model_construct(
+            tasks=[TaskStatusResponse.from_task(make_task())], total=1
+        )
+
+        data = json.loads(response.model_dump_json())
+
+        assert data["total"] == 1
+        assert data["tasks"][0]["result_image_url"] == build_full_url("results/7_result.png")
+        assert "result_image_path" not in data["tasks"][0]